@@ -1,62 +1,308 @@
-
+import argparse
+import json
 import os
+import random
+import shutil
+import tempfile
 import time
+from collections import Counter
+from src.batching import AdaptiveBatchBudget
+from src.generator import CHECKPOINT_SUFFIX, PROMPT_MODES, CNERGenerator
+from src.rate_limiter import DEFAULT_RPM, DEFAULT_TPM, RateLimiter
+from src.response_cache import ResponseCache
+from rich.console import Console
+from rich.progress import BarColumn, Progress, ProgressColumn, TextColumn, TimeElapsedColumn, TimeRemainingColumn
+from rich.table import Table
+from rich.text import Text
+
+# Gemini 2.5 Flash pricing based on user-provided information
+COST_PER_MILLION_INPUT_TOKENS = 0.30
+COST_PER_MILLION_OUTPUT_TOKENS = 2.50
+# Context-cached input is billed at a tenth of the input price (storage not included)
+COST_PER_MILLION_CACHED_TOKENS = 0.03
+
+console = Console()
+
+
+def usage_cost(usage):
+    """
+    Dollar cost of a CNERGenerator.token_usage counter. Thinking tokens are
+    billed as output, and cached prompt tokens at the cached rate.
+    """
+    uncached = usage["prompt"] - usage["cached"]
+    return (
+        uncached * COST_PER_MILLION_INPUT_TOKENS
+        + usage["cached"] * COST_PER_MILLION_CACHED_TOKENS
+        + (usage["output"] + usage["thoughts"]) * COST_PER_MILLION_OUTPUT_TOKENS
+    ) / 1_000_000
+
+
+def sample_corpus(input_file, start_offset, sample_size, seed=0):
+    """
+    Reads the corpus once from start_offset (where a checkpointed run left
+    off) and returns (uniform sample of its sentences, number of sentences left).
+    """
+    rng = random.Random(seed)
+    sample = []
+    remaining = 0
+    with open(input_file, "rb") as f:
+        f.seek(start_offset)
+        for line in f:
+            sentence = line.decode("utf-8").strip()
+            if not sentence:
+                continue
+            remaining += 1
+            if len(sample) < sample_size:
+                sample.append(sentence)
+            else:
+                j = rng.randrange(remaining)
+                if j < sample_size:
+                    sample[j] = sentence
+    return sample, remaining
+
+
+def make_generator(args, response_cache=None, metrics_path=None):
+    return CNERGenerator(
+        model_name=args.model_name,
+        rate_limiter=RateLimiter(rpm=args.rpm, tpm=args.tpm),
+        response_cache=response_cache,
+        prompt_mode=args.prompt_mode,
+        context_cache=not args.no_context_cache,
+        metrics_path=metrics_path,
+    )
+
+
+def process(generator, args, input_file, output_file, progress):
+    try:
+        generator.process_file(
+            input_file,
+            output_file,
+            batch_size=args.batch_size,
+            progress=progress,
+            concurrency=args.concurrency,
+            token_budget=AdaptiveBatchBudget(initial=args.token_budget) if args.token_budget else None,
+        )
+    finally:
+        generator.close_metrics()
+
+
+def run_sample(args, sample, response_cache):
+    """
+    Annotates the sample with the same settings as the mass run and returns
+    what it cost: sentences sent to the API, seconds, requests and token usage.
+    With the response cache on, the sample's answers are reused by the mass run.
+    """
+    hits_before = response_cache.stats()["hits"] if response_cache else 0
+    work_dir = tempfile.mkdtemp(prefix="cner-sample-")
+    try:
+        sample_file = os.path.join(work_dir, "sample.txt")
+        with open(sample_file, "w", encoding="utf-8") as f:
+            f.writelines(sentence + "\n" for sentence in sample)
+
+        generator = make_generator(args, response_cache)
+        start = time.perf_counter()
+        with Progress(console=console) as progress:
+            process(generator, args, sample_file, os.path.join(work_dir, "sample.jsonl"), progress)
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    hits = (response_cache.stats()["hits"] if response_cache else 0) - hits_before
+    return {
+        "sentences": len(sample) - hits,
+        "seconds": seconds,
+        "requests": len(generator.call_log),
+        "usage": Counter(generator.token_usage),
+    }
+
+
+def estimate_generation_cost_and_time(sample_stats, remaining, args):
+    """
+    Scales the sample run up to the `remaining` sentences still to be sent
+    to the API. The ETA is the slowest of the sample's throughput and the
+    request and token quotas, since a short sample never runs into the
+    per-minute limits. The total cost includes what the sample itself cost.
+    Returns the forecast, or None if the sample made no API calls.
+    """
+    sentences = sample_stats["sentences"]
+    if sentences <= 0:
+        return None
+    scale = remaining / sentences
+    usage = sample_stats["usage"]
+    tokens = usage["prompt"] + usage["output"] + usage["thoughts"]
+    bounds = {
+        "sample throughput": sample_stats["seconds"] * scale,
+        "requests per minute": sample_stats["requests"] * scale / args.rpm * 60,
+        "tokens per minute": tokens * scale / args.tpm * 60,
+    }
+    bottleneck = max(bounds, key=bounds.get)
+    return {
+        "sentences": remaining,
+        "input_tokens": usage["prompt"] * scale,
+        "output_tokens": (usage["output"] + usage["thoughts"]) * scale,
+        "cost": usage_cost(usage) * scale,
+        "sample_cost": usage_cost(usage),
+        "total_cost": usage_cost(usage) * (1 + scale),
+        "cost_per_1k": usage_cost(usage) / sentences * 1000,
+        "seconds": bounds[bottleneck],
+        "bottleneck": bottleneck,
+    }
+
+
+def print_forecast(sample_stats, forecast, cache_enabled=True):
+    table = Table(title="Mass Generation Forecast (from sample run)")
+    table.add_column("Metric", style="cyan")
+    table.add_column("Value", justify="right", style="magenta")
+    sentences = sample_stats["sentences"]
+    usage = sample_stats["usage"]
+    table.add_row("Sample sentences sent to the API", str(sentences))
+    table.add_row("Sample wall time", f"{sample_stats['seconds']:.1f}s")
+    table.add_row("Sample throughput", f"{sentences / sample_stats['seconds']:.2f} sentences/s")
+    table.add_row("Requests per 1k sentences", f"{sample_stats['requests'] / sentences * 1000:.1f}")
+    table.add_row("Input tokens per sentence", f"{usage['prompt'] / sentences:.1f} ({usage['cached'] / sentences:.1f} cached)")
+    table.add_row("Output tokens per sentence", f"{(usage['output'] + usage['thoughts']) / sentences:.1f}")
+    table.add_row("Sentences to annotate", f"{forecast['sentences']:,}")
+    table.add_row(
+        "Estimated tokens",
+        f"{forecast['input_tokens'] + forecast['output_tokens']:,.0f} "
+        f"(Input: {forecast['input_tokens']:,.0f}, Output: {forecast['output_tokens']:,.0f})",
+    )
+    table.add_row("Sample cost (already spent)", f"${forecast['sample_cost']:.2f}")
+    table.add_row("Estimated cost of the mass run", f"${forecast['cost']:.2f}")
+    table.add_row("Estimated total cost", f"${forecast['total_cost']:.2f}")
+    table.add_row("Cost per 1k sentences", f"${forecast['cost_per_1k']:.3f}")
+    table.add_row("Estimated time", f"{forecast['seconds'] / 3600:.2f} hours (limited by {forecast['bottleneck']})")
+    console.print(table)
+    if not cache_enabled:
+        console.log(
+            f"[bold yellow]The response cache is disabled, so the mass run annotates (and pays for) "
+            f"the {sentences} sample sentences again.[/bold yellow]"
+        )
+
+
+class UsageColumn(ProgressColumn):
+    """Live tokens/s and $/1k sentences of a running CNERGenerator."""
+
+    def __init__(self, generator):
+        super().__init__()
+        self.generator = generator
+
+    def render(self, task):
+        with self.generator.token_usage_lock:
+            usage = Counter(self.generator.token_usage)
+        tokens = usage["prompt"] + usage["output"] + usage["thoughts"]
+        elapsed = task.elapsed or 0
+        rate = f"{tokens / elapsed:,.0f} tok/s" if elapsed else "- tok/s"
+        sentences = self.generator.sentences_written
+        cost = usage_cost(usage)
+        per_1k = f"${cost / sentences * 1000:.3f}/1k sent" if sentences else "-/1k sent"
+        return Text(f"{rate}  {per_1k}  ${cost:.2f} total", style="green")
 
-def estimate_generation_cost_and_time():
-    """
-    Estimates the cost and time for mass data generation.
-    """
-    # Constants
-    SENTENCE_COUNT = 5713
-    # Using a conservative estimate of tokens per sentence
-    AVG_TOKENS_PER_SENTENCE = 100  # This is a rough estimate
-    # Gemini API rate limit (example, replace with actual)
-    REQUESTS_PER_MINUTE = 60
-    SENTENCES_PER_REQUEST = 1 # Assuming one sentence per API call for simplicity
-
-    # Gemini 2.5 Flash pricing based on user-provided information
-    COST_PER_MILLION_INPUT_TOKENS = 0.30
-    COST_PER_MILLION_OUTPUT_TOKENS = 2.50
-    # Assuming a 1:1 ratio of input to output tokens for estimation
-    AVG_TOKENS_PER_SENTENCE_INPUT = 50
-    AVG_TOKENS_PER_SENTENCE_OUTPUT = 50
-
-    # Calculations
-    total_input_tokens = SENTENCE_COUNT * AVG_TOKENS_PER_SENTENCE_INPUT
-    total_output_tokens = SENTENCE_COUNT * AVG_TOKENS_PER_SENTENCE_OUTPUT
-    total_tokens = total_input_tokens + total_output_tokens
-
-    estimated_input_cost = (total_input_tokens / 1_000_000) * COST_PER_MILLION_INPUT_TOKENS
-    estimated_output_cost = (total_output_tokens / 1_000_000) * COST_PER_MILLION_OUTPUT_TOKENS
-    estimated_cost = estimated_input_cost + estimated_output_cost
-
-    total_requests = SENTENCE_COUNT / SENTENCES_PER_REQUEST
-    estimated_time_minutes = total_requests / REQUESTS_PER_MINUTE
-    estimated_time_hours = estimated_time_minutes / 60
-
-    print("--- Mass Generation Estimates (Updated Pricing) ---")
-    print(f"Corpus Size: {SENTENCE_COUNT} sentences")
-    print(f"Estimated Total Tokens: {total_tokens} (Input: {total_input_tokens}, Output: {total_output_tokens})")
-    print(f"Estimated Cost: ${estimated_cost:.2f} (Input: ${estimated_input_cost:.2f}, Output: ${estimated_output_cost:.2f})")
-    print(f"Estimated Time: {estimated_time_minutes:.2f} minutes (~{estimated_time_hours:.2f} hours)")
-    print("---------------------------------------------------")
 
 def main():
     """
-    Main function to confirm and start the mass generation process.
-    """
-    estimate_generation_cost_and_time()
-    
-    confirm = input("Do you want to start the mass generation process? (yes/no): ")
-    
-    if confirm.lower() == 'yes':
-        print("Starting mass generation... (This is a simulation)")
-        # In a real scenario, you would call the generator.py script here.
-        # For now, we'll just simulate the process.
-        time.sleep(5) 
-        print("Mass generation process completed. (Simulation)")
+    Forecasts cost and time from a sample of the real corpus, then, after
+    confirmation, runs the mass generation with live progress.
+    """
+    parser = argparse.ArgumentParser(description="Forecast and launch CNER mass generation.")
+    parser.add_argument("input_file", help="Corpus to annotate (one sentence per line).")
+    parser.add_argument("output_file", help="Output JSONL file; the run resumes from its checkpoint.")
+    parser.add_argument("--sample_size", type=int, default=500, help="Sentences to annotate for the forecast.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for drawing the sample.")
+    parser.add_argument("--batch_size", type=int, default=200, help="Maximum number of sentences in each batch.")
+    parser.add_argument("--token_budget", type=int, default=8000, help="Initial estimated tokens per batch (0 for fixed-size batches).")
+    parser.add_argument("--model_name", type=str, default="gemini-2.5-flash", help="The Gemini model to use.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of batches to process at once.")
+    parser.add_argument("--cache_path", type=str, default="data/response_cache.sqlite3", help="On-disk response cache ('' to disable).")
+    parser.add_argument("--cache_size_mb", type=int, default=512, help="Maximum size of the response cache.")
+    parser.add_argument("--prompt_mode", choices=PROMPT_MODES, default="random", help="Randomly sampled or all (fixed, cacheable) few-shot examples.")
+    parser.add_argument("--no_context_cache", action="store_true", help="In static mode, send the full prompt instead of using a Gemini context cache.")
+    parser.add_argument("--rpm", type=float, default=DEFAULT_RPM, help="Requests per minute allowed by your quota.")
+    parser.add_argument("--tpm", type=float, default=DEFAULT_TPM, help="Tokens per minute allowed by your quota.")
+    parser.add_argument("--metrics_path", type=str, default=None, help="Per-call metrics log (default: output file + .metrics.jsonl).")
+    parser.add_argument("--yes", action="store_true", help="Start the mass run without asking.")
+    args = parser.parse_args()
+
+    if not os.environ.get("GEMINI_API_KEY"):
+        console.log("[bold red]Please set the GEMINI_API_KEY environment variable.[/bold red]")
+        return
+    if not os.path.exists(args.input_file):
+        console.log(f"[bold red]Input file not found: {args.input_file}[/bold red]")
+        return
+
+    # Forecast only what is left after a previous, checkpointed run
+    start_offset = 0
+    checkpoint_path = args.output_file + CHECKPOINT_SUFFIX
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            start_offset = json.load(f)["input_offset"]
+
+    sample, remaining = sample_corpus(args.input_file, start_offset, args.sample_size, args.seed)
+    if not remaining:
+        console.log(f"Nothing left to annotate in {args.input_file}.")
+        return
+
+    response_cache = None
+    if args.cache_path:
+        cache_dir = os.path.dirname(args.cache_path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        response_cache = ResponseCache(args.cache_path, max_bytes=args.cache_size_mb * 1024 * 1024)
+
+    console.log(f"[bold green]Annotating a sample of {len(sample)} of {remaining:,} sentences for the forecast...[/bold green]")
+    sample_stats = run_sample(args, sample, response_cache)
+    # The answers the sample got from the API are now in the response cache,
+    # so the mass run skips them; sample sentences that were already cached
+    # are cache hits in both runs and stay in the count
+    forecast = estimate_generation_cost_and_time(
+        sample_stats, remaining - (sample_stats["sentences"] if response_cache else 0), args
+    )
+    if forecast is None:
+        console.log("[bold yellow]The whole sample was answered from the response cache; try another --seed.[/bold yellow]")
     else:
-        print("Mass generation cancelled.")
+        print_forecast(sample_stats, forecast, cache_enabled=response_cache is not None)
+
+    if not args.yes:
+        confirm = input("Do you want to start the mass generation process? (yes/no): ")
+        if confirm.lower() != "yes":
+            print("Mass generation cancelled.")
+            return
+
+    metrics_path = args.metrics_path or args.output_file + ".metrics.jsonl"
+    generator = make_generator(args, response_cache, metrics_path)
+    progress = Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        TimeElapsedColumn(),
+        TextColumn("ETA"),
+        TimeRemainingColumn(),
+        UsageColumn(generator),
+        console=console,
+    )
+    start = time.perf_counter()
+    try:
+        with progress:
+            process(generator, args, args.input_file, args.output_file, progress)
+    finally:
+        if response_cache:
+            response_cache.close()
+    seconds = time.perf_counter() - start
+
+    cost = usage_cost(generator.token_usage)
+    sentences = generator.sentences_written
+    console.log(
+        f"[bold green]Mass generation finished:[/bold green] {sentences:,} sentences in {seconds / 3600:.2f} hours, "
+        f"${cost:.2f} (${cost / sentences * 1000 if sentences else 0:.3f}/1k sentences)"
+        + (
+            f"; forecast was ${forecast['cost']:.2f} and {forecast['seconds'] / 3600:.2f} hours, "
+            f"plus ${forecast['sample_cost']:.2f} for the sample"
+            if forecast
+            else ""
+        )
+        + f". Per-call metrics in {metrics_path}"
+    )
+
 
 if __name__ == "__main__":
     main()
@@ -1,38 +1,146 @@
+import argparse
+import math
 import os
-from src.generator import CNERGenerator
+import statistics
+import time
+from src.batching import AdaptiveBatchBudget
+from src.fake_gemini import FakeGeminiClient
+from src.generator import CHECKPOINT_SUFFIX, APIUnavailableError, CNERGenerator
+from src.rate_limiter import RateLimiter
 from rich.console import Console
 from rich.progress import Progress
+from rich.table import Table
 
 
-def run_stress_test():
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def count_lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def report(console, generator, elapsed, input_sentences, output_file):
+    """Prints throughput, call latency, retry and wasted-token figures for a run."""
+    output_sentences = count_lines(output_file) if os.path.exists(output_file) else 0
+    latencies = [call["latency"] for call in generator.call_log]
+    errors = sum(1 for call in generator.call_log if call["status"] != "ok")
+    limiter = generator.rate_limiter.stats()
+    usage = generator.token_usage
+
+    table = Table(title="Stress Test Results")
+    table.add_column("Metric", style="cyan")
+    table.add_column("Value", justify="right", style="magenta")
+    table.add_row("Input sentences", str(input_sentences))
+    table.add_row("Output sentences", str(output_sentences))
+    table.add_row("Wall time", f"{elapsed:.1f}s")
+    table.add_row("Sentences/s", f"{output_sentences / elapsed:.2f}" if elapsed else "-")
+    table.add_row("API calls", str(len(latencies)))
+    table.add_row("Failed calls", str(errors))
+    table.add_row("Call latency p50", f"{percentile(latencies, 50):.2f}s")
+    table.add_row("Call latency p95", f"{percentile(latencies, 95):.2f}s")
+    table.add_row("Call latency p99", f"{percentile(latencies, 99):.2f}s")
+    table.add_row("Mean call latency", f"{statistics.mean(latencies):.2f}s" if latencies else "-")
+    table.add_row("Retries", str(limiter["retries"]))
+    table.add_row("Rate limited (429)", str(limiter["rate_limited"]))
+    table.add_row("Time waiting on limiter/backoff", f"{limiter['waited_seconds']:.1f}s")
+    table.add_row("Batch splits", str(generator.split_count))
+    table.add_row("Lost sentences", str(generator.lost_sentences))
+    table.add_row("Prompt tokens", f"{usage['prompt']:,}")
+    table.add_row("Output tokens", f"{usage['output']:,}")
+    table.add_row("Output tokens in damaged responses", f"{generator.salvage_stats['wasted_tokens']:,}")
+    console.print(table)
+
+
+def run_stress_test(args):
     console = Console()
 
-    # Check for API Key
-    if not os.environ.get("GEMINI_API_KEY"):
-        console.log("[bold red]Please set GEMINI_API_KEY environment variable.[/bold red]")
-        return
+    if args.fake:
+        # Scripted backend: no key needed, and the same seed gives the same run
+        client = FakeGeminiClient(
+            annotations_path=args.annotations,
+            latency=args.latency,
+            latency_jitter=args.jitter,
+            rate_429=args.rate_429,
+            rate_503=args.rate_503,
+            truncation_rate=args.truncation_rate,
+            max_output_tokens=args.max_output_tokens,
+            retry_delay=args.retry_delay,
+            seed=args.seed,
+        )
+        rate_limiter = RateLimiter(
+            rpm=args.rpm, tpm=args.tpm, base_backoff=args.retry_delay, max_backoff=10 * args.retry_delay
+        )
+    else:
+        # Check for API Key
+        if not os.environ.get("GEMINI_API_KEY"):
+            console.log("[bold red]Please set GEMINI_API_KEY environment variable, or pass --fake.[/bold red]")
+            return
+        client = None
+        rate_limiter = RateLimiter(rpm=args.rpm, tpm=args.tpm)
 
-    input_file = "stress_test_sentences.txt"
-    output_file = "stress_test_output.jsonl"
+    input_file = args.input_file
+    output_file = args.output_file
 
     if not os.path.exists(input_file):
         console.log(f"[bold red]Error: {input_file} not found. Please create it first.[/bold red]")
         return
 
-    console.log(f"[bold green]Starting Stress Test on {input_file}...[/bold green]")
-    # Using the new default model gemini-1.5-flash-latest
-    generator = CNERGenerator()
+    backend = "fake backend" if args.fake else "Gemini API"
+    console.log(f"[bold green]Starting Stress Test on {input_file} against the {backend}...[/bold green]")
+    generator = CNERGenerator(rate_limiter=rate_limiter, client=client)
 
-    # Remove old output if exists
-    if os.path.exists(output_file):
-        os.remove(output_file)
+    # Remove old output and its checkpoint if they exist
+    for path in (output_file, output_file + CHECKPOINT_SUFFIX):
+        if os.path.exists(path):
+            os.remove(path)
 
-    # Increased batch size to 50 for efficiency as per user request
-    with Progress() as progress:
-        generator.process_file(input_file, output_file, batch_size=50, progress=progress)
+    token_budget = AdaptiveBatchBudget(initial=args.token_budget) if args.token_budget else None
+    start = time.perf_counter()
+    try:
+        with Progress() as progress:
+            generator.process_file(
+                input_file,
+                output_file,
+                batch_size=args.batch_size,
+                progress=progress,
+                concurrency=args.concurrency,
+                token_budget=token_budget,
+            )
+        console.log("[bold green]Stress Test Completed![/bold green]")
+    except APIUnavailableError:
+        # Error rates high enough to exhaust the retries are still worth measuring
+        console.log("[bold yellow]Stress Test stopped early: the API kept failing.[/bold yellow]")
+    elapsed = time.perf_counter() - start
 
-    console.log("[bold green]Stress Test Completed![/bold green]")
+    report(console, generator, elapsed, count_lines(input_file), output_file)
 
 
 if __name__ == "__main__":
-    run_stress_test()
+    parser = argparse.ArgumentParser(description="Measure generator throughput against the Gemini API or a local fake.")
+    parser.add_argument("--input_file", type=str, default="stress_test_sentences.txt")
+    parser.add_argument("--output_file", type=str, default="stress_test_output.jsonl")
+    parser.add_argument("--batch_size", type=int, default=50)
+    parser.add_argument("--token_budget", type=int, default=0, help="Adaptive token budget per batch (0 = fixed-size batches)")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--rpm", type=float, default=60)
+    parser.add_argument("--tpm", type=float, default=1_000_000)
+    parser.add_argument("--fake", action="store_true", help="Use the local fake backend instead of the API")
+    parser.add_argument("--annotations", type=str, default="test_output.jsonl", help="Canned annotations for the fake backend")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake base call latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Fake latency jitter in seconds")
+    parser.add_argument("--rate_429", type=float, default=0.0, help="Fraction of fake calls answered with 429")
+    parser.add_argument("--rate_503", type=float, default=0.0, help="Fraction of fake calls answered with 503")
+    parser.add_argument("--truncation_rate", type=float, default=0.0, help="Fraction of fake answers cut short")
+    parser.add_argument("--max_output_tokens", type=int, default=None, help="Fake output limit; longer answers are truncated")
+    parser.add_argument("--retry_delay", type=float, default=0.5, help="Retry delay the fake asks for, and the base backoff")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    run_stress_test(args)
@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+from rich.console import Console
+from rich.table import Table
+
+# The preprocessing modules import each other as top-level modules
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from segment_cache import SegmentationCache
+from segmenters import SEGMENTERS, get_segmenter
+from tokenizer import tokenize_line
+
+
+def boundaries(tokens):
+    """
+    Returns the character offsets at which a segmentation places word breaks.
+    """
+    offsets = set()
+    position = 0
+    for token in tokens:
+        position += len(token)
+        offsets.add(position)
+    return offsets
+
+
+def run_tokenizer_benchmark(input_file="stress_test_sentences.txt", wordlist="data/wordlist.txt", repeat=3):
+    console = Console()
+
+    if not os.path.exists(input_file):
+        console.log(f"[bold red]Error: {input_file} not found.[/bold red]")
+        return
+    if not os.path.exists(wordlist):
+        console.log(
+            f"[bold yellow]No word list at {wordlist}; the syllable backend will only break syllables. "
+            f"Build one with: python src/segmenters.py data/tokenized/corpus_full.txt {wordlist}[/bold yellow]"
+        )
+
+    with open(input_file, "r", encoding="utf-8") as f:
+        sentences = [line.strip() for line in f if line.strip()]
+
+    results = {}
+    table = Table(title=f"Tokenizer backends on {input_file} ({len(sentences)} sentences)")
+    table.add_column("Backend")
+    table.add_column("Sentences/s", justify="right")
+    table.add_column("Boundary F1", justify="right")
+    table.add_column("Exact match", justify="right")
+
+    for name in SEGMENTERS:
+        segmenter = get_segmenter(name, wordlist)
+        segmenter.segment("မြန်မာ")
+        best = None
+        for _ in range(repeat):
+            # A fresh, disabled cache for every pass so only segmentation is timed
+            cache = SegmentationCache(maxsize=0)
+            start_time = time.perf_counter()
+            output = [tokenize_line(sentence, cache=cache, backend=segmenter) for sentence in sentences]
+            elapsed = time.perf_counter() - start_time
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = output
+
+        reference = results["pyidaungsu"]
+        matched = predicted = expected = exact = 0
+        for ours, theirs in zip(output, reference):
+            ours_breaks, their_breaks = boundaries(ours.split()), boundaries(theirs.split())
+            matched += len(ours_breaks & their_breaks)
+            predicted += len(ours_breaks)
+            expected += len(their_breaks)
+            exact += ours == theirs
+        precision = matched / predicted if predicted else 0.0
+        recall = matched / expected if expected else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        table.add_row(name, f"{len(sentences) / best:.0f}", f"{f1:.1%}", f"{exact / len(sentences):.1%}")
+
+    console.print(table)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare the speed and output of the tokenizer backends.")
+    parser.add_argument("--input_file", type=str, default="stress_test_sentences.txt", help="One sentence per line.")
+    parser.add_argument("--wordlist", type=str, default="data/wordlist.txt", help="Word list for the syllable backend.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes per backend; the fastest is reported.")
+    args = parser.parse_args()
+
+    run_tokenizer_benchmark(args.input_file, args.wordlist, args.repeat)
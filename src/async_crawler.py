@@ -0,0 +1,293 @@
+import asyncio
+import os
+import time
+from urllib.parse import urlparse
+import aiohttp
+from bs4 import BeautifulSoup
+from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn
+from crawler import extract_links, log
+from frontier import CrawlFrontier
+from bloom import BloomFilter
+from recrawl import PageUnchanged, ValidatorStore
+from urls import DEFAULT_EXCLUDE_PATTERNS, DEFAULT_URL_FILTER, UrlFilter, canonicalize_url
+from scraper import scrape_page
+
+USER_AGENT = "Mozilla/5.0 (compatible; my-cner-crawler)"
+
+
+class HostLimiter:
+    """
+    Limits the number of concurrent requests and the request rate for one host.
+    The rate limit and the politeness delay both translate into a minimum
+    interval between the start of two consecutive requests.
+    """
+
+    def __init__(self, max_concurrency=10, requests_per_second=None, politeness_delay=0.0):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        rate_interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.min_interval = max(rate_interval, politeness_delay)
+        self.next_slot = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        if self.min_interval:
+            # Reserve the next free start slot before sleeping so waiters queue up fairly
+            now = asyncio.get_running_loop().time()
+            start = max(now, self.next_slot)
+            self.next_slot = start + self.min_interval
+            if start > now:
+                await asyncio.sleep(start - now)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.semaphore.release()
+
+
+class AsyncCrawler:
+    """
+    Crawls a website on a single asyncio event loop. Fetches share one pooled
+    HTTP session and are pulled from a continuous work queue, so a slow page
+    never holds back the rest of the frontier.
+    """
+
+    def __init__(
+        self,
+        start_url,
+        max_concurrency=200,
+        per_host_concurrency=20,
+        requests_per_second=None,
+        politeness_delay=0.0,
+        timeout=15,
+        state_path=None,
+        url_filter=None,
+        bloom_capacity=None,
+        validator_path=None,
+    ):
+        self.start_url = canonicalize_url(start_url)
+        if self.start_url is None:
+            raise ValueError(f"Malformed start URL: {start_url!r}")
+        self.netloc = urlparse(self.start_url).netloc
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.requests_per_second = requests_per_second
+        self.politeness_delay = politeness_delay
+        self.timeout = timeout
+        self.state_path = state_path
+        self.url_filter = url_filter or DEFAULT_URL_FILTER
+        self.bloom_capacity = bloom_capacity
+        self.validator_path = validator_path
+        self.frontier = None
+        self.validators = None
+        self.crawled_count = 0
+        self.host_limiters = {}
+
+    def get_host_limiter(self, url):
+        host = urlparse(url).netloc
+        if host not in self.host_limiters:
+            self.host_limiters[host] = HostLimiter(
+                max_concurrency=self.per_host_concurrency,
+                requests_per_second=self.requests_per_second,
+                politeness_delay=self.politeness_delay,
+            )
+        return self.host_limiters[host]
+
+    async def fetch(self, session, url):
+        """
+        Fetches a page and returns its raw body, or None if it is not an HTML page.
+        In incremental mode the request is conditional and PageUnchanged is
+        raised for unchanged pages.
+        """
+        headers = self.validators.request_headers(url) if self.validators else {}
+        async with self.get_host_limiter(url):
+            async with session.get(url, headers=headers) as response:
+                body = await response.read()
+                if self.validators:
+                    self.validators.check_response(url, response.status, response.headers, body)
+                response.raise_for_status()
+                if "html" not in response.headers.get("Content-Type", "text/html"):
+                    return None
+        return body
+
+    def process_page(self, body, url):
+        """
+        Parses and scrapes a fetched page and returns the links found on it.
+        Runs in a worker thread so parsing never blocks the event loop.
+        """
+        soup = BeautifulSoup(body, "lxml")
+        if scrape_page(soup, url) and self.validators:
+            self.validators.commit(url)
+        return list(extract_links(soup, url, self.netloc, self.url_filter))
+
+    async def crawl_page(self, session, url, queue):
+        """
+        Crawls a single page, scrapes it, and adds newly discovered links to the frontier.
+        """
+        try:
+            body = await self.fetch(session, url)
+            if body is None:
+                log.info(f"Skipping non-HTML page: {url}")
+                return None
+
+            links = await asyncio.to_thread(self.process_page, body, url)
+            for full_url in links:
+                self.frontier.add(full_url)
+            return f"Crawled {url}"
+        except PageUnchanged:
+            return f"Unchanged {url}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.error(f"Could not fetch {url}: {e}")
+        except Exception as e:
+            log.error(f"An error occurred while processing {url}: {e}")
+        finally:
+            if self.validators:
+                # Validators of a page that was not scraped are dropped, so it is fetched again next time
+                self.validators.discard(url)
+            self.frontier.mark_done(url)
+            # The frontier is the source of truth; the queue only dispatches its pending URLs
+            for pending_url in self.frontier.pop_all():
+                queue.put_nowait(pending_url)
+        return None
+
+    async def worker(self, session, queue, progress, task):
+        while True:
+            url = await queue.get()
+            try:
+                description = await self.crawl_page(session, url, queue)
+                self.crawled_count += 1
+                if description:
+                    progress.update(task, description=description)
+                progress.update(task, advance=1, total=self.frontier.seen_count)
+            finally:
+                queue.task_done()
+
+    async def run(self):
+        """
+        Crawls the site until the work queue is drained. Returns the number of pages crawled.
+        """
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrency,
+            limit_per_host=self.per_host_concurrency,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        queue = asyncio.Queue()
+        seen = BloomFilter(self.bloom_capacity) if self.bloom_capacity else None
+        self.frontier = CrawlFrontier(self.state_path or ":memory:", seen=seen)
+        if self.frontier.seen_count and not self.frontier.pending_count:
+            log.info(f"Previous crawl in {self.state_path} is complete, starting a new one")
+            self.frontier.reset()
+        if not self.frontier.add(self.start_url):
+            log.info(
+                f"Resuming crawl from {self.state_path}: {self.frontier.seen_count} URLs seen, "
+                f"{self.frontier.pending_count} pending"
+            )
+
+        if self.validator_path:
+            self.validators = ValidatorStore(self.validator_path)
+            # Revisit every known page, since unchanged pages yield no links to follow
+            for url in self.validators.urls():
+                if urlparse(url).netloc == self.netloc:
+                    self.frontier.add(url)
+        for url in self.frontier.pop_all():
+            queue.put_nowait(url)
+
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+            TextColumn("({task.completed} of {task.total})"),
+            transient=False,
+        ) as progress:
+            task = progress.add_task(
+                "Crawling...",
+                total=self.frontier.seen_count,
+                completed=self.frontier.seen_count - queue.qsize(),
+            )
+            async with aiohttp.ClientSession(
+                connector=connector, timeout=timeout, headers={"User-Agent": USER_AGENT}
+            ) as session:
+                workers = [
+                    asyncio.create_task(self.worker(session, queue, progress, task))
+                    for _ in range(self.max_concurrency)
+                ]
+                try:
+                    await queue.join()
+                finally:
+                    for worker in workers:
+                        worker.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+                    self.frontier.close()
+                    if self.validators:
+                        self.validators.close()
+
+        return self.crawled_count
+
+
+def crawl_website_async(
+    start_url,
+    max_concurrency=200,
+    per_host_concurrency=20,
+    requests_per_second=None,
+    politeness_delay=0.0,
+    state_path=None,
+    url_filter=None,
+    bloom_capacity=None,
+    validator_path=None,
+):
+    """
+    Crawls a website with the asyncio crawler and logs its throughput.
+    Returns the number of pages crawled.
+    """
+    crawler = AsyncCrawler(
+        start_url,
+        max_concurrency=max_concurrency,
+        per_host_concurrency=per_host_concurrency,
+        requests_per_second=requests_per_second,
+        politeness_delay=politeness_delay,
+        state_path=state_path,
+        url_filter=url_filter,
+        bloom_capacity=bloom_capacity,
+        validator_path=validator_path,
+    )
+    start_time = time.perf_counter()
+    pages = asyncio.run(crawler.run())
+    elapsed = time.perf_counter() - start_time
+    log.info(
+        f"Crawled {pages} pages in {elapsed:.1f}s "
+        f"({pages / elapsed if elapsed else 0:.2f} pages/sec, mode=async)"
+    )
+    if crawler.validators:
+        log.info(f"{crawler.validators.unchanged_count} pages unchanged since the last crawl")
+    return pages
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Crawl a news site with the asyncio crawler.")
+    parser.add_argument("start_url", nargs="?", default="https://www.duwun.com.mm/", help="URL to start crawling from.")
+    parser.add_argument("--max_concurrency", type=int, default=200, help="Maximum number of in-flight fetches.")
+    parser.add_argument("--per_host_concurrency", type=int, default=20, help="Maximum in-flight fetches per host.")
+    parser.add_argument("--requests_per_second", type=float, default=None, help="Per-host request rate limit.")
+    parser.add_argument("--politeness_delay", type=float, default=0.0, help="Minimum seconds between requests to a host.")
+    parser.add_argument("--state_path", type=str, default="data/crawl_state.sqlite3", help="SQLite file holding the resumable crawl frontier.")
+    parser.add_argument("--exclude", action="append", default=[], help="Extra regex for URLs to skip (repeatable).")
+    parser.add_argument("--bloom_capacity", type=int, default=None, help="Use a Bloom filter sized for this many URLs as the visited-set.")
+    parser.add_argument("--incremental", action="store_true", help="Only re-download pages that changed since the last crawl.")
+    parser.add_argument("--validator_path", type=str, default="data/page_validators.sqlite3", help="SQLite file holding ETag/Last-Modified/content hashes.")
+    args = parser.parse_args()
+
+    if os.path.dirname(args.state_path):
+        os.makedirs(os.path.dirname(args.state_path), exist_ok=True)
+    crawl_website_async(
+        args.start_url,
+        max_concurrency=args.max_concurrency,
+        per_host_concurrency=args.per_host_concurrency,
+        requests_per_second=args.requests_per_second,
+        politeness_delay=args.politeness_delay,
+        state_path=args.state_path,
+        url_filter=UrlFilter(DEFAULT_EXCLUDE_PATTERNS + args.exclude),
+        bloom_capacity=args.bloom_capacity,
+        validator_path=args.validator_path if args.incremental else None,
+    )
@@ -0,0 +1,118 @@
+"""
+Lazy, token-budgeted batching of input sentences for annotation.
+"""
+
+import threading
+from typing import Optional
+
+from src.rate_limiter import estimate_tokens
+
+# The JSON answer repeats each sentence and adds its entities, so output
+# runs at roughly twice the input plus a fixed overhead per sentence
+OUTPUT_TOKENS_PER_INPUT_TOKEN = 2
+OUTPUT_TOKENS_PER_SENTENCE = 20
+
+
+def estimate_sentence_tokens(sentence: str) -> int:
+    """Estimated input plus output tokens one sentence adds to a request."""
+    input_tokens = estimate_tokens(sentence)
+    return input_tokens * (1 + OUTPUT_TOKENS_PER_INPUT_TOKEN) + OUTPUT_TOKENS_PER_SENTENCE
+
+
+class AdaptiveBatchBudget:
+    """
+    Token budget per batch that tunes itself to maximize sentences per
+    second. Throughput is measured over a window of batches and the budget
+    is hill-climbed: it keeps moving in the same direction while throughput
+    improves and turns around when it drops. A batch that had to be split
+    because of truncated or malformed output shrinks the budget at once.
+    """
+
+    def __init__(
+        self,
+        initial: int = 8000,
+        minimum: int = 1000,
+        maximum: int = 32000,
+        step: float = 0.1,
+        decrease: float = 0.75,
+        window: int = 4,
+    ):
+        self.tokens = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.decrease = decrease
+        self.window = window
+        self.direction = 1
+        self.samples = []
+        self.last_throughput = None
+        self.lock = threading.Lock()
+
+    def _clamp(self, tokens: float) -> int:
+        return int(min(self.maximum, max(self.minimum, tokens)))
+
+    def record(self, sentences: int, seconds: float, failed: bool = False):
+        """
+        Records a finished batch: its size, how long it took, and whether any
+        part of it failed.
+        """
+        with self.lock:
+            if failed:
+                self.tokens = self._clamp(self.tokens * self.decrease)
+                self.direction = -1
+                self.samples.clear()
+                self.last_throughput = None
+                return
+            self.samples.append((sentences, seconds))
+            if len(self.samples) < self.window:
+                return
+            total_seconds = sum(seconds for _, seconds in self.samples)
+            throughput = sum(sentences for sentences, _ in self.samples) / total_seconds if total_seconds else 0.0
+            self.samples.clear()
+            if self.last_throughput is not None and throughput < self.last_throughput:
+                self.direction = -self.direction
+            self.last_throughput = throughput
+            self.tokens = self._clamp(self.tokens * (1 + self.step * self.direction))
+
+
+def iter_batches(
+    input_file: str,
+    batch_size: int,
+    start_offset: int = 0,
+    skip_sentences: set = frozenset(),
+    budget: Optional[AdaptiveBatchBudget] = None,
+):
+    """
+    Lazily reads the non-empty lines of a file from a byte offset in batches
+    of at most batch_size sentences and, with a budget, at most
+    budget.tokens estimated tokens (a single longer sentence still forms a
+    batch). The budget is read as each batch is formed, so it can change
+    during the run. Yields (sentences, offset just past the batch's last line).
+    """
+    batch = []
+    batch_tokens = 0
+    offset = start_offset
+    batch_end = start_offset
+    with open(input_file, "rb") as f:
+        f.seek(start_offset)
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            sentence = line.decode("utf-8").strip()
+            if sentence and sentence not in skip_sentences:
+                tokens = estimate_sentence_tokens(sentence) if budget else 0
+                if batch and budget and batch_tokens + tokens > budget.tokens:
+                    yield batch, batch_end
+                    batch = []
+                    batch_tokens = 0
+                batch.append(sentence)
+                batch_tokens += tokens
+            offset += len(line)
+            batch_end = offset
+            if len(batch) == batch_size:
+                yield batch, batch_end
+                batch = []
+                batch_tokens = 0
+    if batch:
+        yield batch, batch_end
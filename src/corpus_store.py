@@ -0,0 +1,184 @@
+import glob
+import gzip
+import io
+import json
+import os
+import re
+import time
+from threading import Lock
+from scrape_index import ScrapeIndex, content_hash
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Errors raised when reading a compressed shard whose tail was torn by a crash
+_DAMAGED_SHARD_ERRORS = (EOFError, zstandard.ZstdError) if zstandard else (EOFError,)
+
+SHARD_EXTENSIONS = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+SHARD_PATTERN = re.compile(r"^(?P<prefix>.+)-(?P<number>\d{5})\.jsonl(?:\.gz|\.zst)?$")
+
+
+def _open_shard(path, mode):
+    """
+    Opens a shard for text reading ("r") or writing ("w"), choosing the
+    compression from the file extension.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("zstd shards need the 'zstandard' package: pip install zstandard")
+        raw = open(path, mode + "b")
+        if mode == "r":
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def list_shards(directory, prefix="raw"):
+    """
+    Returns the paths of all shards in a directory, in write order.
+    """
+    shards = []
+    for path in glob.glob(os.path.join(directory, f"{prefix}-*.jsonl*")):
+        match = SHARD_PATTERN.match(os.path.basename(path))
+        if match and match.group("prefix") == prefix:
+            shards.append((int(match.group("number")), path))
+    return [path for _, path in sorted(shards)]
+
+
+def iter_shard(path):
+    """
+    Yields the records of a single shard. A shard cut short by a crash yields
+    every record up to the damaged tail.
+    """
+    try:
+        with _open_shard(path, "r") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    return
+    except _DAMAGED_SHARD_ERRORS:
+        return
+
+
+def iter_records(directory="data/raw", prefix="raw"):
+    """
+    Yields every record ({"url", "title", "fetched_at", "text"}) in the corpus store.
+    """
+    for path in list_shards(directory, prefix):
+        yield from iter_shard(path)
+
+
+class ShardWriter:
+    """
+    Appends article records to rotating JSONL shards in a directory, with
+    optional gzip or zstd compression. A shard is closed and a new one started
+    once `max_shard_bytes` of uncompressed JSON has been written to it. Every
+    writer starts a fresh shard, so existing shards are never modified.
+    Writes are thread-safe and flushed per record.
+    """
+
+    def __init__(self, directory="data/raw", max_shard_bytes=64 * 1024 * 1024, compression="gzip", prefix="raw"):
+        if compression not in SHARD_EXTENSIONS:
+            raise ValueError(f"Unknown compression {compression!r}, expected one of {list(SHARD_EXTENSIONS)}")
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression needs the 'zstandard' package: pip install zstandard")
+
+        self.directory = directory
+        self.max_shard_bytes = max_shard_bytes
+        self.compression = compression
+        self.prefix = prefix
+        self.lock = Lock()
+        self.file = None
+        self.shard_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        existing = list_shards(directory, prefix)
+        if existing:
+            self.next_number = int(SHARD_PATTERN.match(os.path.basename(existing[-1])).group("number")) + 1
+        else:
+            self.next_number = 0
+
+    def _rotate(self):
+        if self.file:
+            self.file.close()
+        filename = f"{self.prefix}-{self.next_number:05d}{SHARD_EXTENSIONS[self.compression]}"
+        self.path = os.path.join(self.directory, filename)
+        self.file = _open_shard(self.path, "w")
+        self.shard_bytes = 0
+        self.next_number += 1
+
+    def write(self, url, title, text, fetched_at=None):
+        """
+        Appends one article record and returns the path of the shard it went to.
+        """
+        record = {
+            "url": url,
+            "title": title,
+            "fetched_at": fetched_at if fetched_at is not None else time.time(),
+            "text": text,
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.file is None or self.shard_bytes >= self.max_shard_bytes:
+                self._rotate()
+            self.file.write(line)
+            self.file.flush()
+            self.shard_bytes += len(line.encode("utf-8"))
+            return self.path
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+def migrate_text_files(raw_dir="data/raw", compression="gzip", index_path="data/raw_index.jsonl"):
+    """
+    Packs legacy one-file-per-article .txt files into shards and removes them.
+    Each article's title and content hash go into the scrape index first, so
+    the scraper keeps skipping them once the files are gone.
+    """
+    filenames = sorted(f for f in os.listdir(raw_dir) if f.endswith(".txt"))
+    index = ScrapeIndex(raw_dir, index_path)
+    writer = ShardWriter(raw_dir, compression=compression)
+    try:
+        for filename in filenames:
+            path = os.path.join(raw_dir, filename)
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            title = filename[: -len(".txt")]
+            writer.write(None, title, text, fetched_at=os.path.getmtime(path))
+            index.register(title, None, content_hash(text))
+    finally:
+        writer.close()
+        index.close()
+
+    for filename in filenames:
+        os.remove(os.path.join(raw_dir, filename))
+    print(f"Migrated {len(filenames)} files into shards in {raw_dir}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the sharded raw corpus store.")
+    parser.add_argument("command", choices=["migrate", "stats"], help="migrate: pack legacy .txt files into shards; stats: count records.")
+    parser.add_argument("--raw_dir", type=str, default="data/raw", help="Directory of the raw corpus.")
+    parser.add_argument("--compression", choices=["none", "gzip", "zstd"], default="gzip", help="Compression for new shards.")
+    parser.add_argument("--index_path", type=str, default="data/raw_index.jsonl", help="Scrape index to register migrated articles in.")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate_text_files(args.raw_dir, None if args.compression == "none" else args.compression, args.index_path)
+    else:
+        shards = list_shards(args.raw_dir)
+        records = sum(1 for _ in iter_records(args.raw_dir))
+        print(f"{records} records in {len(shards)} shards")
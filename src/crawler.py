@@ -1,5 +1,8 @@
+import os
 import time
 from urllib.parse import urljoin, urlparse
+import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.common.exceptions import WebDriverException
@@ -8,10 +11,13 @@ from webdriver_manager.chrome import ChromeDriverManager
 from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn
 from rich.logging import RichHandler
 import logging
-from scraper import scrape_page
+from scraper import find_article, scrape_page
+from frontier import CrawlFrontier
+from bloom import BloomFilter
+from recrawl import PageUnchanged, ValidatorStore
+from urls import DEFAULT_EXCLUDE_PATTERNS, DEFAULT_URL_FILTER, UrlFilter, canonicalize_url
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import queue
-from threading import Lock
 
 # Configure logging with RichHandler
 logging.basicConfig(
@@ -23,6 +29,9 @@ logging.basicConfig(
 
 log = logging.getLogger("rich")
 
+CRAWL_MODES = ("static", "browser", "auto")
+REQUEST_TIMEOUT = 15
+
 
 class WebDriverManager:
     def __init__(self, num_drivers=5):
@@ -51,60 +60,188 @@ class WebDriverManager:
             driver.quit()
 
 
+def create_http_session(pool_size=10):
+    """
+    Creates a requests session whose connection pool is large enough to be
+    shared by all crawler threads, so connections to the site are reused.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"User-Agent": "Mozilla/5.0 (compatible; my-cner-crawler)"})
+    return session
 
 
-def crawl_page(url, driver_manager, crawled_urls, pages_to_crawl, netloc, lock):
+def fetch_static(url, session, validators=None):
     """
-    Crawls a single page, scrapes it, and finds new links.
+    Fetches a page with a plain HTTP GET and returns the parsed HTML,
+    or None if the response is not an HTML page. With a ValidatorStore the
+    request is conditional and PageUnchanged is raised for unchanged pages
+    before any parsing happens.
     """
-    with lock:
-        if url in crawled_urls:
-            return None, []
-        crawled_urls.add(url)
+    headers = validators.request_headers(url) if validators else {}
+    response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if validators:
+        validators.check_response(url, response.status_code, response.headers, response.content)
+    response.raise_for_status()
+    if "html" not in response.headers.get("Content-Type", "text/html"):
+        return None
+    return BeautifulSoup(response.content, "lxml")
+
 
+def fetch_browser(url, driver_manager, validators=None):
+    """
+    Renders a page in one of the pooled Selenium drivers and returns the parsed HTML.
+    With a ValidatorStore, PageUnchanged is raised if the rendered article
+    (or, on other pages, the whole rendered source) hashes the same as on
+    the last crawl; a browser has no ETag to send.
+    """
     driver = driver_manager.get_driver()
     try:
         driver.get(url)
-        scrape_page(driver, url)
-        
-        soup = BeautifulSoup(driver.page_source, "lxml")
-        new_links = []
-        for link in soup.find_all("a", href=True):
-            full_url = urljoin(url, link["href"])
-            if "videos" in full_url:
-                continue
-            with lock:
-                if (
-                    urlparse(full_url).netloc == netloc
-                    and full_url not in crawled_urls
-                    and full_url not in pages_to_crawl
-                ):
-                    new_links.append(full_url)
-                    pages_to_crawl.add(full_url)
+        page_source = driver.page_source
+    finally:
+        driver_manager.return_driver(driver)
+    soup = BeautifulSoup(page_source, "lxml")
+    if validators:
+        # Hash the article rather than the page, whose ads and widgets change on every render
+        title_tag, content = find_article(soup)
+        if title_tag and content:
+            body = title_tag.get_text() + "\n" + content.get_text(separator="\n", strip=True)
+        else:
+            body = page_source
+        validators.check_response(url, 200, {}, body.encode("utf-8"))
+    return soup
 
+
+def fetch_page(url, mode, session, driver_manager, validators=None):
+    """
+    Fetches a page according to the crawl mode. In "auto" mode the static
+    HTML is used unless it lacks the article title or content container,
+    in which case the page is rendered in the browser instead.
+    """
+    if mode == "browser":
+        return fetch_browser(url, driver_manager, validators)
+
+    soup = fetch_static(url, session, validators)
+    if mode == "static":
+        return soup
+
+    if soup is not None:
+        title_tag, content = find_article(soup)
+        if title_tag and content:
+            return soup
+    log.debug(f"Static HTML incomplete, falling back to browser: {url}")
+    return fetch_browser(url, driver_manager)
+
+
+def extract_links(soup, url, netloc, url_filter=DEFAULT_URL_FILTER):
+    """
+    Yields the canonical absolute URLs of all links on the page that stay on
+    the crawled site and pass the URL filter.
+    """
+    for link in soup.find_all("a", href=True):
+        try:
+            full_url = canonicalize_url(urljoin(url, link["href"]))
+        except ValueError:
+            continue  # e.g. an unbalanced IPv6 bracket
+        if full_url and urlparse(full_url).netloc == netloc and url_filter.allows(full_url):
+            yield full_url
+
+
+def crawl_page(url, mode, session, driver_manager, frontier, netloc, url_filter, validators=None):
+    """
+    Crawls a single page, scrapes it, and adds new links to the frontier.
+    """
+    try:
+        soup = fetch_page(url, mode, session, driver_manager, validators)
+        if soup is None:
+            log.info(f"Skipping non-HTML page: {url}")
+            return None, []
+
+        if scrape_page(soup, url) and validators:
+            validators.commit(url)
+
+        new_links = [
+            full_url for full_url in extract_links(soup, url, netloc, url_filter) if frontier.add(full_url)
+        ]
         return f"Crawled {url}", new_links
-    except WebDriverException as e:
+    except PageUnchanged:
+        return f"Unchanged {url}", []
+    except (requests.RequestException, WebDriverException) as e:
         log.error(f"Could not fetch {url}: {e}")
         return None, []
     except Exception as e:
         log.error(f"An error occurred while processing {url}: {e}")
         return None, []
     finally:
-        driver_manager.return_driver(driver)
+        if validators:
+            # Validators of a page that was not scraped are dropped, so it is fetched again next time
+            validators.discard(url)
+        frontier.mark_done(url)
 
 
-def crawl_website(start_url, max_workers=5):
+def crawl_website(
+    start_url,
+    max_workers=5,
+    mode="auto",
+    state_path=None,
+    url_filter=None,
+    bloom_capacity=None,
+    validator_path=None,
+):
     """
     Crawls a website starting from a given URL, scrapes each page,
     and follows internal links using a thread pool.
+
+    mode selects how pages are fetched: "static" uses plain HTTP only,
+    "browser" renders every page in headless Chrome, and "auto" uses plain
+    HTTP and falls back to the browser for pages missing article markup.
+    If state_path is given, the frontier and visited-set are persisted there
+    and a restarted crawl resumes from where it stopped.
+    url_filter (a urls.UrlFilter) decides which discovered links are followed.
+    If bloom_capacity is given, the visited-set is a Bloom filter sized for
+    that many URLs instead of a set of strings.
+    If validator_path is given, the crawl is incremental: every previously
+    crawled URL is revisited with a conditional request, and pages that come
+    back 304 or with an unchanged content hash are not parsed or written.
+    In browser mode only the hash of the rendered article is compared.
+    Returns the number of pages crawled.
     """
+    if mode not in CRAWL_MODES:
+        raise ValueError(f"Unknown crawl mode {mode!r}, expected one of {CRAWL_MODES}")
+
+    canonical_url = canonicalize_url(start_url)
+    if canonical_url is None:
+        raise ValueError(f"Malformed start URL: {start_url!r}")
+    start_url = canonical_url
     netloc = urlparse(start_url).netloc
-    crawled_urls = set()
-    pages_to_crawl = {start_url}
-    lock = Lock()
+    url_filter = url_filter or DEFAULT_URL_FILTER
+    seen = BloomFilter(bloom_capacity) if bloom_capacity else None
+    frontier = CrawlFrontier(state_path or ":memory:", seen=seen)
+    if frontier.seen_count and not frontier.pending_count:
+        log.info(f"Previous crawl in {state_path} is complete, starting a new one")
+        frontier.reset()
+    if not frontier.add(start_url):
+        log.info(
+            f"Resuming crawl from {state_path}: {frontier.seen_count} URLs seen, "
+            f"{frontier.pending_count} pending"
+        )
 
-    driver_manager = WebDriverManager(num_drivers=max_workers)
+    validators = ValidatorStore(validator_path) if validator_path else None
+    if validators:
+        # Revisit every known page, since unchanged pages yield no links to follow
+        for url in validators.urls():
+            if urlparse(url).netloc == netloc:
+                frontier.add(url)
+    crawled_count = 0
 
+    session = create_http_session(pool_size=max_workers)
+    # Chrome is only started when the mode can actually need it
+    driver_manager = WebDriverManager(num_drivers=max_workers) if mode != "static" else None
+
+    start_time = time.perf_counter()
     try:
         with Progress(
             SpinnerColumn(),
@@ -115,27 +252,65 @@ def crawl_website(start_url, max_workers=5):
             transient=False,
         ) as progress:
             with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                task = progress.add_task("Crawling...", total=len(pages_to_crawl))
-                
-                while pages_to_crawl:
-                    with lock:
-                        urls_to_crawl = list(pages_to_crawl)
-                        pages_to_crawl.clear()
+                task = progress.add_task(
+                    "Crawling...",
+                    total=frontier.seen_count,
+                    completed=frontier.seen_count - frontier.pending_count,
+                )
 
-                    futures = {executor.submit(crawl_page, url, driver_manager, crawled_urls, pages_to_crawl, netloc, lock) for url in urls_to_crawl}
+                while frontier.pending_count:
+                    urls_to_crawl = frontier.pop_all()
+
+                    futures = {executor.submit(crawl_page, url, mode, session, driver_manager, frontier, netloc, url_filter, validators) for url in urls_to_crawl}
 
                     for future in as_completed(futures):
                         description, new_links = future.result()
+                        crawled_count += 1
                         if description:
                             progress.update(task, description=description)
-                        
-                        progress.update(task, advance=1, total=len(crawled_urls) + len(pages_to_crawl))
+
+                        progress.update(task, advance=1, total=frontier.seen_count)
 
     finally:
-        driver_manager.shutdown()
+        frontier.close()
+        if validators:
+            validators.close()
+        session.close()
+        if driver_manager:
+            driver_manager.shutdown()
 
+    elapsed = time.perf_counter() - start_time
+    log.info(
+        f"Crawled {crawled_count} pages in {elapsed:.1f}s "
+        f"({crawled_count / elapsed if elapsed else 0:.2f} pages/sec, mode={mode})"
+    )
+    if validators:
+        log.info(f"{validators.unchanged_count} pages unchanged since the last crawl")
+    return crawled_count
 
 
 if __name__ == "__main__":
-    start_url = "https://www.duwun.com.mm/"
-    crawl_website(start_url, max_workers=10)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Crawl a news site and scrape its articles.")
+    parser.add_argument("start_url", nargs="?", default="https://www.duwun.com.mm/", help="URL to start crawling from.")
+    parser.add_argument("--max_workers", type=int, default=10, help="Number of crawler threads.")
+    parser.add_argument("--mode", choices=CRAWL_MODES, default="auto", help="How pages are fetched.")
+    parser.add_argument("--state_path", type=str, default="data/crawl_state.sqlite3", help="SQLite file holding the resumable crawl frontier.")
+    parser.add_argument("--exclude", action="append", default=[], help="Extra regex for URLs to skip (repeatable).")
+    parser.add_argument("--bloom_capacity", type=int, default=None, help="Use a Bloom filter sized for this many URLs as the visited-set.")
+    parser.add_argument("--incremental", action="store_true", help="Only re-download pages that changed since the last crawl.")
+    parser.add_argument("--validator_path", type=str, default="data/page_validators.sqlite3", help="SQLite file holding ETag/Last-Modified/content hashes.")
+    args = parser.parse_args()
+
+    if os.path.dirname(args.state_path):
+        os.makedirs(os.path.dirname(args.state_path), exist_ok=True)
+    crawl_website(
+        args.start_url,
+        max_workers=args.max_workers,
+        mode=args.mode,
+        state_path=args.state_path,
+        url_filter=UrlFilter(DEFAULT_EXCLUDE_PATTERNS + args.exclude),
+        bloom_capacity=args.bloom_capacity,
+        validator_path=args.validator_path if args.incremental else None,
+    )
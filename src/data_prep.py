@@ -1,35 +1,205 @@
 import os
 import glob
+import math
+import random
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from dedup import SentenceDeduplicator
 
+# Output is written in blocks of about this many bytes
+WRITE_BUFFER_BYTES = 4 * 1024 * 1024
+# Largest bucket the shuffle loads into memory at once
+MAX_BUCKET_BYTES = 256 * 1024 * 1024
+INDEX_SUFFIX = ".idx"
+OFFSET = struct.Struct("<Q")
 
-def merge_sanitized_files(source_dir, output_file):
+
+def iter_sanitized_sentences(txt_files):
+    """
+    Streams the non-empty lines of the sanitized files, in the order given.
+    """
+    for txt_file in txt_files:
+        with open(txt_file, "r", encoding="utf-8") as infile:
+            for line in infile:
+                line = line.strip()
+                if line:
+                    yield line
+
+
+class IndexedCorpusWriter:
+    """
+    Writes one sentence per line in large blocks, and alongside it an index
+    of little-endian uint64 byte offsets: the start of every sentence followed
+    by the end of the file, so sentence n spans offsets n to n + 1.
+    """
+
+    def __init__(self, output_file, index_file=None):
+        self.output_file = output_file
+        self.index_file = index_file
+        self.outfile = open(output_file, "wb")
+        self.indexfile = open(index_file, "wb") if index_file else None
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.offsets = array("Q")
+        self.position = 0
+        self.count = 0
+
+    def write(self, sentence):
+        data = (sentence + "\n").encode("utf-8")
+        self.buffer.append(data)
+        self.buffered_bytes += len(data)
+        self.offsets.append(self.position)
+        self.position += len(data)
+        self.count += 1
+        if self.buffered_bytes >= WRITE_BUFFER_BYTES:
+            self.flush()
+
+    def flush(self):
+        self.outfile.write(b"".join(self.buffer))
+        self.buffer.clear()
+        self.buffered_bytes = 0
+        if self.indexfile:
+            if sys.byteorder != "little":
+                self.offsets.byteswap()
+            self.indexfile.write(self.offsets.tobytes())
+        del self.offsets[:]
+
+    def close(self):
+        self.flush()
+        self.outfile.close()
+        if self.indexfile:
+            self.indexfile.write(OFFSET.pack(self.position))
+            self.indexfile.close()
+
+
+def read_sentence(corpus_file, number, index_file=None):
+    """
+    Fetches sentence `number` (0-based) of a corpus through its offset index,
+    without scanning the corpus.
+    """
+    if number < 0:
+        raise IndexError(f"Sentence {number} is out of range for {corpus_file}")
+    index_file = index_file or corpus_file + INDEX_SUFFIX
+    with open(index_file, "rb") as f:
+        f.seek(number * OFFSET.size)
+        data = f.read(2 * OFFSET.size)
+    if len(data) < 2 * OFFSET.size:
+        raise IndexError(f"Sentence {number} is out of range for {corpus_file}")
+    start, end = OFFSET.unpack_from(data, 0)[0], OFFSET.unpack_from(data, OFFSET.size)[0]
+    with open(corpus_file, "rb") as f:
+        f.seek(start)
+        return f.read(end - start).decode("utf-8").rstrip("\n")
+
+
+def count_sentences(corpus_file, index_file=None):
+    index_file = index_file or corpus_file + INDEX_SUFFIX
+    return os.path.getsize(index_file) // OFFSET.size - 1
+
+
+def external_shuffle(sentences, writer, work_dir, num_buckets, seed=0):
+    """
+    Shuffles a stream of sentences larger than memory: every sentence goes to
+    a random on-disk bucket, then each bucket is loaded, shuffled and written
+    out in turn. The result is a uniform shuffle that only depends on the
+    seed and the input order.
+    """
+    rng = random.Random(seed)
+    bucket_paths = [os.path.join(work_dir, f"bucket-{i:05d}.txt") for i in range(num_buckets)]
+    buckets = [open(path, "w", encoding="utf-8", buffering=1024 * 1024) for path in bucket_paths]
+    try:
+        for sentence in sentences:
+            buckets[rng.randrange(num_buckets)].write(sentence + "\n")
+    finally:
+        for bucket in buckets:
+            bucket.close()
+
+    for path in bucket_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        os.remove(path)
+        rng.shuffle(lines)
+        for line in lines:
+            writer.write(line)
+
+
+def merge_sanitized_files(
+    source_dir,
+    output_file,
+    dedupe=True,
+    near_duplicates=False,
+    shuffle=False,
+    seed=0,
+    write_index=True,
+    max_bucket_bytes=MAX_BUCKET_BYTES,
+):
     """
     Merges all .txt files from the source directory into a single output file.
+    Files are read once, in name order, and the output is written in large
+    blocks. With dedupe, repeated sentences (and, with near_duplicates,
+    sentences that are nearly the same) are written only once. With shuffle,
+    sentences are shuffled by a seeded on-disk bucket shuffle, so the same
+    input and seed always give the same corpus. With write_index, a byte
+    offset index is saved next to the output (see read_sentence).
     """
     print(f"Merging files from {source_dir} into {output_file}...")
 
-    txt_files = glob.glob(os.path.join(source_dir, "*.txt"))
+    txt_files = sorted(glob.glob(os.path.join(source_dir, "*.txt")))
 
     if not txt_files:
         print("No .txt files found in source directory.")
         return
 
-    total_sentences = 0
-    with open(output_file, "w", encoding="utf-8") as outfile:
-        for txt_file in txt_files:
-            with open(txt_file, "r", encoding="utf-8") as infile:
-                for line in infile:
-                    line = line.strip()
-                    if line:
-                        outfile.write(line + "\n")
-                        total_sentences += 1
-
-    print(f"Successfully merged {len(txt_files)} files.")
-    print(f"Total sentences: {total_sentences}")
+    start_time = time.perf_counter()
+    deduplicator = SentenceDeduplicator(near_duplicates=near_duplicates) if dedupe else None
+    sentences = iter_sanitized_sentences(txt_files)
+    if deduplicator:
+        sentences = deduplicator.filter(sentences)
+
+    # Build under temporary names so an interrupted run leaves the old corpus intact
+    index_file = output_file + INDEX_SUFFIX
+    writer = IndexedCorpusWriter(output_file + ".tmp", index_file + ".tmp" if write_index else None)
+    try:
+        if shuffle:
+            input_bytes = sum(os.path.getsize(path) for path in txt_files)
+            num_buckets = max(1, math.ceil(input_bytes / max_bucket_bytes))
+            with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_file))) as work_dir:
+                external_shuffle(sentences, writer, work_dir, num_buckets, seed=seed)
+        else:
+            for sentence in sentences:
+                writer.write(sentence)
+    finally:
+        writer.close()
+    os.replace(output_file + ".tmp", output_file)
+    if write_index:
+        os.replace(index_file + ".tmp", index_file)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Successfully merged {len(txt_files)} files in {elapsed:.1f}s.")
+    print(f"Total sentences: {writer.count}")
+    if deduplicator:
+        print(deduplicator.report())
+    if shuffle:
+        print(f"Shuffled with seed {seed}")
     print(f"Saved to: {output_file}")
+    if write_index:
+        print(f"Offset index saved to: {index_file}")
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge the sanitized files into one corpus.")
+    parser.add_argument("--no_dedupe", action="store_true", help="Keep duplicate sentences.")
+    parser.add_argument("--near_duplicates", action="store_true", help="Also drop MinHash/LSH near-duplicates.")
+    parser.add_argument("--shuffle", action="store_true", help="Shuffle the sentences (deterministic for a given seed).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for --shuffle.")
+    parser.add_argument("--no_index", action="store_true", help="Do not write the byte offset index.")
+    parser.add_argument("--max_bucket_mb", type=int, default=MAX_BUCKET_BYTES // (1024 * 1024), help="Memory used per shuffle bucket.")
+    args = parser.parse_args()
+
     # Define paths relative to the project root
     source_directory = "data/sanitized"
     output_filename = "data/corpus_full.txt"
@@ -38,4 +208,13 @@ if __name__ == "__main__":
     if not os.path.exists("data"):
         os.makedirs("data")
 
-    merge_sanitized_files(source_directory, output_filename)
+    merge_sanitized_files(
+        source_directory,
+        output_filename,
+        dedupe=not args.no_dedupe,
+        near_duplicates=args.near_duplicates,
+        shuffle=args.shuffle,
+        seed=args.seed,
+        write_index=not args.no_index,
+        max_bucket_bytes=args.max_bucket_mb * 1024 * 1024,
+    )
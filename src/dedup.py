@@ -0,0 +1,137 @@
+import hashlib
+import random
+import re
+import unicodedata
+from bloom import BloomFilter
+
+# Rough characters-per-token ratio used to estimate the API tokens a
+# duplicate would have cost to annotate
+CHARS_PER_TOKEN = 3
+
+MERSENNE_PRIME = (1 << 61) - 1
+_INVISIBLE = re.compile(r"[\u200b\u200c\u200d\u2060\ufeff]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sentence(text):
+    """
+    Builds the comparison key of a sentence: NFC-normalized and casefolded,
+    without zero-width characters or any whitespace, since spacing between
+    Burmese words is inconsistent across sites.
+    """
+    text = unicodedata.normalize("NFC", text)
+    text = _INVISIBLE.sub("", text)
+    return _WHITESPACE.sub("", text).casefold()
+
+
+def estimate_tokens(text):
+    return max(1, round(len(text) / CHARS_PER_TOKEN))
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class MinHashLSH:
+    """
+    Streaming near-duplicate detector. Each sentence key is reduced to a
+    MinHash signature over its character shingles and split into bands; a
+    sentence is a near-duplicate if any band matches a band of an earlier
+    kept sentence. Band buckets live in a Bloom filter, so memory is fixed
+    up front. With the defaults, sentences with a shingle Jaccard similarity
+    above roughly 0.77 are caught.
+    """
+
+    def __init__(self, num_perm=64, bands=8, shingle_size=5, capacity=5_000_000, error_rate=0.001, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self.permutations = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)
+        ]
+        self.buckets = BloomFilter(capacity * bands, error_rate)
+
+    def signature(self, key):
+        n = self.shingle_size
+        shingles = {key[i : i + n] for i in range(max(1, len(key) - n + 1))}
+        hashes = [_hash64(shingle) for shingle in shingles]
+        return [min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in self.permutations]
+
+    def check_and_add(self, key):
+        """
+        Returns True if the key is a near-duplicate of an earlier one;
+        otherwise remembers it and returns False.
+        """
+        signature = self.signature(key)
+        band_keys = [
+            f"{band}:" + ",".join(map(str, signature[band * self.rows : (band + 1) * self.rows]))
+            for band in range(self.bands)
+        ]
+        if any(band_key in self.buckets for band_key in band_keys):
+            return True
+        for band_key in band_keys:
+            self.buckets.add(band_key)
+        return False
+
+
+class SentenceDeduplicator:
+    """
+    Drops exact duplicates (by normalized-text hash) and, optionally,
+    near-duplicates from a stream of sentences, keeping the first occurrence.
+    Seen sentences are tracked in Bloom filters sized for `capacity`
+    sentences, so memory stays bounded; the price is that about one in
+    1/error_rate unique sentences is wrongly dropped.
+    """
+
+    def __init__(self, capacity=5_000_000, error_rate=1e-6, near_duplicates=False, **lsh_kwargs):
+        self.exact = BloomFilter(capacity, error_rate)
+        self.lsh = MinHashLSH(capacity=capacity, **lsh_kwargs) if near_duplicates else None
+        self.total = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self.tokens_saved = 0
+
+    def is_duplicate(self, sentence):
+        self.total += 1
+        key = normalize_sentence(sentence)
+        if not self.exact.add(key):
+            self.exact_duplicates += 1
+        elif self.lsh and self.lsh.check_and_add(key):
+            self.near_duplicates += 1
+        else:
+            return False
+        self.tokens_saved += estimate_tokens(sentence)
+        return True
+
+    def filter(self, sentences):
+        for sentence in sentences:
+            if not self.is_duplicate(sentence):
+                yield sentence
+
+    def report(self):
+        removed = self.exact_duplicates + self.near_duplicates
+        return (
+            f"Removed {removed} of {self.total} sentences "
+            f"({self.exact_duplicates} exact, {self.near_duplicates} near-duplicate), "
+            f"saving ~{self.tokens_saved} input tokens of annotation"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Remove duplicate sentences from a one-sentence-per-line file.")
+    parser.add_argument("input_file", help="Path to the input text file.")
+    parser.add_argument("output_file", help="Path to the deduplicated output file.")
+    parser.add_argument("--near_duplicates", action="store_true", help="Also drop MinHash/LSH near-duplicates.")
+    parser.add_argument("--capacity", type=int, default=5_000_000, help="Expected number of sentences.")
+    args = parser.parse_args()
+
+    deduplicator = SentenceDeduplicator(capacity=args.capacity, near_duplicates=args.near_duplicates)
+    with open(args.input_file, "r", encoding="utf-8") as infile, open(args.output_file, "w", encoding="utf-8") as outfile:
+        for sentence in deduplicator.filter(line.strip() for line in infile if line.strip()):
+            outfile.write(sentence + "\n")
+    print(deduplicator.report())
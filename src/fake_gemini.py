@@ -0,0 +1,249 @@
+"""
+A local stand-in for the Gemini client, for offline load and regression tests.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from google.genai import errors
+
+from src.prompts import ENTITY_LABELS
+from src.rate_limiter import estimate_tokens
+from src.response_cache import normalize_sentence
+
+# The numbered sentence list at the end of an extraction prompt (see prompts.format_sentences)
+_SENTENCE_LIST_HEADER = "Please process the following sentences and return the JSON object with the 'sentences' key:"
+_NUMBERED_LINE = re.compile(r"^\d+\. (.+)$", re.MULTILINE)
+_MYANMAR = re.compile(r"[က-႟]")
+
+
+class FakeUsageMetadata:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int, cached_content_token_count: int = 0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage_metadata: FakeUsageMetadata):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def _ttl_seconds(config: Any) -> Optional[float]:
+    ttl = getattr(config, "ttl", None)
+    return float(ttl.rstrip("s")) if ttl else None
+
+
+def _not_found(name: str) -> errors.ClientError:
+    return errors.ClientError(
+        404, {"error": {"code": 404, "message": f"CachedContent not found: {name}", "status": "NOT_FOUND"}}
+    )
+
+
+class FakeCachedContent:
+    def __init__(self, name: str, tokens: int, expires: Optional[float] = None):
+        self.name = name
+        self.tokens = tokens
+        self.expires = expires
+
+
+class FakeCaches:
+    """Context caches that expire after their TTL, like the real ones."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.entries = {}
+        self.created = 0
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    def create(self, model: str, config: Any = None) -> FakeCachedContent:
+        contents = getattr(config, "contents", None) or []
+        tokens = sum(estimate_tokens(str(content)) for content in contents)
+        ttl = _ttl_seconds(config)
+        with self.lock:
+            self.created += 1
+            cache = FakeCachedContent(
+                f"cachedContents/fake-{self.created}", tokens, self.clock() + ttl if ttl else None
+            )
+            self.entries[cache.name] = cache
+        return cache
+
+    def get_live(self, name: str) -> Optional[FakeCachedContent]:
+        with self.lock:
+            cache = self.entries.get(name)
+            if cache and cache.expires is not None and cache.expires <= self.clock():
+                del self.entries[name]
+                cache = None
+            return cache
+
+    def update(self, name: str, config: Any = None) -> FakeCachedContent:
+        cache = self.get_live(name)
+        if cache is None:
+            raise _not_found(name)
+        ttl = _ttl_seconds(config)
+        if ttl:
+            cache.expires = self.clock() + ttl
+        return cache
+
+    def delete(self, name: str, config: Any = None):
+        with self.lock:
+            self.entries.pop(name, None)
+
+
+class FakeModels:
+    """
+    Answers generate_content calls like Gemini would, from canned annotations.
+    Sentences found in the canned file get their stored annotation; any other
+    Burmese sentence is tagged with the canned entities it contains, or else
+    with its first word; non-Burmese lines are dropped as invalid sentences.
+    Correction requests are answered by dropping the invalid entities.
+    """
+
+    def __init__(
+        self,
+        annotations: Dict[str, Dict[str, Any]],
+        caches: FakeCaches,
+        latency: float = 0.5,
+        latency_jitter: float = 0.2,
+        latency_per_output_token: float = 0.002,
+        rate_429: float = 0.0,
+        rate_503: float = 0.0,
+        truncation_rate: float = 0.0,
+        max_output_tokens: Optional[int] = None,
+        retry_delay: float = 1.0,
+        seed: int = 0,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.annotations = annotations
+        self.caches = caches
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.latency_per_output_token = latency_per_output_token
+        self.rate_429 = rate_429
+        self.rate_503 = rate_503
+        self.truncation_rate = truncation_rate
+        self.max_output_tokens = max_output_tokens
+        self.retry_delay = retry_delay
+        self.sleep = sleep
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def _annotate(self, sentence: str) -> Optional[Dict[str, Any]]:
+        canned = self.annotations.get(normalize_sentence(sentence))
+        if canned:
+            return canned
+        if not _MYANMAR.search(sentence):
+            return None
+        entities = [
+            entity
+            for annotation in self.annotations.values()
+            for entity in annotation["entities"]
+            if entity["text"] in sentence
+        ]
+        if not entities:
+            first_word = sentence.split()[0]
+            label = ENTITY_LABELS[sum(map(ord, first_word)) % len(ENTITY_LABELS)]
+            entities = [{"text": first_word, "label": label}]
+        return {"text": sentence, "entities": entities}
+
+    def _answer(self, prompt: str) -> str:
+        if "Entries:\n" in prompt:
+            entries = json.loads(prompt[prompt.index("Entries:\n") + len("Entries:\n") :])
+            allowed = set(ENTITY_LABELS)
+            corrections = [
+                {
+                    "index": entry["index"],
+                    "text": entry["text"],
+                    "entities": [entity for entity in entry["entities"] if entity.get("label") in allowed],
+                }
+                for entry in entries
+            ]
+            return json.dumps({"corrections": corrections}, ensure_ascii=False)
+
+        sentence_list = prompt[prompt.rindex(_SENTENCE_LIST_HEADER) :] if _SENTENCE_LIST_HEADER in prompt else prompt
+        results = [self._annotate(sentence.strip()) for sentence in _NUMBERED_LINE.findall(sentence_list)]
+        return json.dumps({"sentences": [result for result in results if result]}, ensure_ascii=False)
+
+    def generate_content(self, model: str, contents: List[Any], config: Any = None) -> FakeResponse:
+        prompt = "".join(str(content) for content in contents)
+        cached_name = getattr(config, "cached_content", None)
+        cached = self.caches.get_live(cached_name) if cached_name else None
+        if cached_name and cached is None:
+            raise _not_found(cached_name)
+        prompt_tokens = estimate_tokens(prompt) + (cached.tokens if cached else 0)
+
+        with self.lock:
+            roll = self.rng.random()
+            truncate_roll = self.rng.random()
+            cut_point = self.rng.random()
+            latency = max(0.0, self.latency + self.rng.uniform(-self.latency_jitter, self.latency_jitter))
+
+        if roll < self.rate_429:
+            self._record(0.0, "429", prompt_tokens, 0)
+            raise errors.ClientError(
+                429,
+                {
+                    "error": {
+                        "code": 429,
+                        "message": f"Resource exhausted. Please retry in {self.retry_delay}s.",
+                        "status": "RESOURCE_EXHAUSTED",
+                    }
+                },
+            )
+        if roll < self.rate_429 + self.rate_503:
+            self.sleep(latency)
+            self._record(latency, "503", prompt_tokens, 0)
+            raise errors.ServerError(
+                503, {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}}
+            )
+
+        text = self._answer(prompt)
+        truncated = False
+        if self.max_output_tokens and estimate_tokens(text) > self.max_output_tokens:
+            text = text[: self.max_output_tokens * 3]
+            truncated = True
+        if truncate_roll < self.truncation_rate:
+            text = text[: max(1, int(len(text) * cut_point))]
+            truncated = True
+        output_tokens = estimate_tokens(text)
+        latency += output_tokens * self.latency_per_output_token
+        self.sleep(latency)
+        self._record(latency, "truncated" if truncated else "ok", prompt_tokens, output_tokens)
+        return FakeResponse(
+            text, FakeUsageMetadata(prompt_tokens, output_tokens, cached.tokens if cached else 0)
+        )
+
+    def _record(self, latency: float, status: str, prompt_tokens: int, output_tokens: int):
+        with self.lock:
+            self.calls.append(
+                {"latency": latency, "status": status, "prompt_tokens": prompt_tokens, "output_tokens": output_tokens}
+            )
+
+
+class FakeGeminiClient:
+    """
+    Drop-in replacement for genai.Client (models.generate_content and
+    caches.create/update/delete) that needs no network or API key. Latency, 429 and
+    503 errors and truncated JSON are injected at the configured rates, from
+    a seeded random source so runs are reproducible.
+    """
+
+    def __init__(self, annotations_path: str = "test_output.jsonl", **options):
+        annotations = {}
+        with open(annotations_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    annotation = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(annotation, dict) and annotation.get("text"):
+                    annotations[normalize_sentence(annotation["text"])] = annotation
+        self.caches = FakeCaches()
+        self.models = FakeModels(annotations, self.caches, **options)
@@ -1,8 +1,11 @@
 import os
 import json
-import time
 import sys
 import random
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from google import genai
 from google.genai import types
 from typing import List, Dict, Any, Optional
@@ -13,7 +16,23 @@ from rich.progress import Progress
 # Add the parent directory to sys.path to allow importing from src
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from src.prompts import SYSTEM_PROMPT, FEW_SHOT_EXAMPLES, VALIDATION_PROMPT
+from src.prompts import (
+    SYSTEM_PROMPT,
+    FEW_SHOT_EXAMPLES,
+    VALIDATION_PROMPT,
+    BATCH_CORRECTION_PROMPT,
+    PROMPT_VERSION,
+    STATIC_PROMPT_PREFIX,
+    RESPONSE_SCHEMA,
+    CORRECTION_RESPONSE_SCHEMA,
+    format_examples,
+    format_sentences,
+)
+from src.batching import AdaptiveBatchBudget, iter_batches
+from src.json_salvage import salvage_array
+from src.label_repair import TAXONOMY, LabelRepairer
+from src.response_cache import MISS, ResponseCache, align_results, cache_key
+from src.rate_limiter import DEFAULT_RPM, DEFAULT_TPM, RateLimiter, estimate_tokens, is_rate_limited, is_retryable, retry_after_hint
 
 load_dotenv()
 
@@ -22,35 +41,287 @@ API_KEY = os.environ.get("GEMINI_API_KEY")
 
 console = Console()
 
+# "static": the same system prompt and examples open every request, so the prefix can be cached.
+# "random": two randomly chosen examples per request, as in earlier runs.
+PROMPT_MODES = ("static", "random")
+# Extend the context cache's TTL once less than this share of it is left
+CONTEXT_CACHE_REFRESH_FRACTION = 0.2
+# Sidecar next to the output file recording how far a run got
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+
+
+class APIUnavailableError(RuntimeError):
+    """
+    Raised when a request still fails with API errors (rate limits, server
+    errors, dropped connections) after every retry. Unlike a malformed
+    answer, this says nothing about the batch, so it is never split or
+    skipped; the run stops and resumes from its checkpoint.
+    """
+
+
+def _invalid_entities(result: Dict[str, Any], taxonomy: set) -> List[Dict[str, Any]]:
+    """Returns the entities of a result whose label is not in the taxonomy."""
+    if not isinstance(result, dict) or not isinstance(result.get("entities"), list):
+        return []
+    return [
+        entity for entity in result["entities"]
+        if isinstance(entity, dict) and "label" in entity and entity["label"] not in taxonomy
+    ]
 
-def _strip_markdown(text: str) -> str:
-    """Removes markdown code block formatting from a string."""
-    text = text.strip()
-    if text.startswith("```json"):
-        text = text[7:]
-    if text.endswith("```"):
-        text = text[:-3]
-    return text.strip()
+
+def _is_not_found(exc: Exception) -> bool:
+    """Whether an API error says the referenced resource does not exist."""
+    return getattr(exc, "code", None) == 404 or getattr(exc, "status", None) == "NOT_FOUND"
+
+
+def _load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_checkpoint(checkpoint: Dict[str, Any], path: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
 
 class CNERGenerator:
-    def __init__(self, model_name: str = "gemini-2.5-flash-lite"):
+    def __init__(
+        self,
+        model_name: str = "gemini-2.5-flash-lite",
+        rate_limiter: Optional[RateLimiter] = None,
+        response_cache: Optional[ResponseCache] = None,
+        prompt_mode: str = "random",
+        context_cache: bool = True,
+        context_cache_ttl: int = 3600,
+        client: Optional[Any] = None,
+        metrics_path: Optional[str] = None,
+    ):
         """
         Initialize the Gemini Generator.
         Args:
             model_name (str): The Gemini model to use. Defaults to "gemini-2.5-flash-lite".
+            rate_limiter (RateLimiter): Limiter shared by every API call. Defaults to one
+                with the default requests and tokens per minute.
+            response_cache (ResponseCache): Optional on-disk cache of per-sentence results.
+            prompt_mode (str): How extraction prompts are built, one of PROMPT_MODES.
+                "random" (the default) sends the system prompt with two sampled
+                examples; "static" sends all examples in a fixed order, which is
+                about twice as long and only pays off with the context cache.
+            context_cache (bool): In static mode, store the prompt prefix in an explicit
+                Gemini context cache and send only the sentences with each request.
+            context_cache_ttl (int): Lifetime of the context cache in seconds. The
+                cache is extended while it is in use, before it expires.
+            client: Object to send requests through instead of a genai.Client; it
+                needs models.generate_content and, for context caching,
+                caches.create/update/delete (e.g. src.fake_gemini.FakeGeminiClient).
+                No API key is needed when one is given.
+            metrics_path (str): JSONL file to append one line per API call to, with
+                its latency, outcome and the token counts from usage_metadata.
         """
-        if not API_KEY:
-            raise ValueError("GEMINI_API_KEY environment variable not set.")
+        if client is None:
+            if not API_KEY:
+                raise ValueError("GEMINI_API_KEY environment variable not set.")
+            client = genai.Client(api_key=API_KEY)
 
-        self.client = genai.Client(api_key=API_KEY)
+        self.client = client
         self.model_name = model_name
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.label_repairer = LabelRepairer()
+        self.response_cache = response_cache
+        if prompt_mode not in PROMPT_MODES:
+            raise ValueError(f"Unknown prompt mode {prompt_mode!r}, expected one of {PROMPT_MODES}")
+        self.prompt_mode = prompt_mode
+        self.use_context_cache = context_cache and prompt_mode == "static"
+        self.context_cache_ttl = context_cache_ttl
+        self.context_cache_name = None
+        self.context_cache_expires = 0.0
+        self.context_cache_lock = threading.Lock()
+        self.token_usage = Counter()
+        self.token_usage_lock = threading.Lock()
+        # Per-thread record of whether the current batch had to be split
+        self.batch_state = threading.local()
+        self.split_count = 0
+        self.lost_sentences = 0
+        self.salvage_stats = Counter()
+        # One entry per API call: latency, outcome and token counts
+        self.call_log = []
+        self.metrics_path = metrics_path
+        self.metrics_file = None
+        # Sentences whose results have been written, for live throughput figures
+        self.sentences_written = 0
+
+    def _call_model(
+        self,
+        prompt: str,
+        temperature: float = 0.0,
+        cached_content: Optional[str] = None,
+        response_schema: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Makes one generate_content call through the shared rate limiter.
+        Errors are raised to the caller, which decides whether to retry.
+        Args:
+            cached_content (str): Name of a context cache holding the start of the prompt.
+            response_schema (Dict): Schema the JSON response is constrained to.
+        """
+        request = "correction" if response_schema is CORRECTION_RESPONSE_SCHEMA else "extraction"
+        estimated_tokens = estimate_tokens(prompt)
+        self.rate_limiter.acquire(estimated_tokens)
+        started = time.perf_counter()
+        try:
+            response = self.client.models.generate_content(
+                model=self.model_name,
+                contents=[prompt],
+                config=types.GenerateContentConfig(
+                    temperature=temperature,
+                    response_mime_type="application/json",
+                    response_schema=response_schema,
+                    cached_content=cached_content,
+                )
+            )
+        except Exception as e:
+            if is_rate_limited(e):
+                self.rate_limiter.on_rate_limited(retry_after_hint(e))
+            with self.token_usage_lock:
+                self._record_call(
+                    {
+                        "request": request,
+                        "latency": time.perf_counter() - started,
+                        "status": "rate_limited" if is_rate_limited(e) else "error",
+                        "error": str(e)[:200],
+                    }
+                )
+            raise
+        latency = time.perf_counter() - started
+
+        usage = getattr(response, "usage_metadata", None)
+        total_tokens = getattr(usage, "total_token_count", None)
+        self.rate_limiter.on_success(total_tokens - estimated_tokens if total_tokens else 0)
+
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+        cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+        output_tokens = getattr(usage, "candidates_token_count", None) or 0
+        # Thinking tokens are billed as output but not counted in candidates_token_count
+        thoughts_tokens = getattr(usage, "thoughts_token_count", None) or 0
+        with self.token_usage_lock:
+            self.token_usage["prompt"] += prompt_tokens
+            self.token_usage["cached"] += cached_tokens
+            self.token_usage["output"] += output_tokens
+            self.token_usage["thoughts"] += thoughts_tokens
+            self._record_call(
+                {
+                    "request": request,
+                    "latency": latency,
+                    "status": "ok",
+                    "prompt_tokens": prompt_tokens,
+                    "cached_tokens": cached_tokens,
+                    "output_tokens": output_tokens,
+                    "thoughts_tokens": thoughts_tokens,
+                }
+            )
+        if usage is not None:
+            console.log(f"Request tokens: {prompt_tokens} prompt ({cached_tokens} cached), {output_tokens} output")
+        return response
+
+    def _get_context_cache(self) -> Optional[str]:
+        """
+        Returns the name of the context cache holding STATIC_PROMPT_PREFIX,
+        creating it on first use and extending its TTL when it is close to
+        expiring. Returns None when context caching is off or the cache cannot
+        be created (e.g. the prefix is below the model's minimum cacheable
+        size), in which case the full prompt is sent.
+        """
+        with self.context_cache_lock:
+            if not self.use_context_cache:
+                return None
+            if self.context_cache_name:
+                remaining = self.context_cache_expires - time.monotonic()
+                if remaining > self.context_cache_ttl * CONTEXT_CACHE_REFRESH_FRACTION:
+                    return self.context_cache_name
+                try:
+                    self.client.caches.update(
+                        name=self.context_cache_name,
+                        config=types.UpdateCachedContentConfig(ttl=f"{self.context_cache_ttl}s"),
+                    )
+                    self.context_cache_expires = time.monotonic() + self.context_cache_ttl
+                    return self.context_cache_name
+                except Exception as e:
+                    console.log(f"[bold yellow]Could not extend context cache {self.context_cache_name}, recreating it: {e}[/bold yellow]")
+                    self.context_cache_name = None
+            try:
+                created = time.monotonic()
+                cache = self.client.caches.create(
+                    model=self.model_name,
+                    config=types.CreateCachedContentConfig(
+                        contents=[STATIC_PROMPT_PREFIX],
+                        ttl=f"{self.context_cache_ttl}s",
+                        display_name=f"cner-prompt-{PROMPT_VERSION}",
+                    ),
+                )
+                self.context_cache_name = cache.name
+                self.context_cache_expires = created + self.context_cache_ttl
+                console.log(f"Created context cache {cache.name} for the prompt prefix.")
+            except Exception as e:
+                console.log(f"[bold yellow]Context caching unavailable, sending full prompts: {e}[/bold yellow]")
+                self.use_context_cache = False
+            return self.context_cache_name
+
+    def _record_call(self, record: Dict[str, Any]):
+        """
+        Adds a call to call_log and the metrics log. Must be called with
+        token_usage_lock held.
+        """
+        record = {"time": time.time(), "model": self.model_name, **record}
+        self.call_log.append(record)
+        if self.metrics_path:
+            if self.metrics_file is None:
+                self.metrics_file = open(self.metrics_path, "a", encoding="utf-8")
+            self.metrics_file.write(json.dumps(record) + "\n")
+            self.metrics_file.flush()
+
+    def close_metrics(self):
+        """Closes the metrics log; it is reopened for appending on the next call."""
+        with self.token_usage_lock:
+            if self.metrics_file is not None:
+                self.metrics_file.close()
+                self.metrics_file = None
+
+    def close_context_cache(self):
+        """Deletes the context cache, if one was created."""
+        with self.context_cache_lock:
+            if self.context_cache_name:
+                try:
+                    self.client.caches.delete(name=self.context_cache_name)
+                except Exception as e:
+                    console.log(f"[bold yellow]Could not delete context cache {self.context_cache_name}: {e}[/bold yellow]")
+                self.context_cache_name = None
+
+    def _build_prompt(self, sentences: List[str]) -> tuple:
+        """
+        Returns the extraction prompt for a batch as (prefix, sentence list).
+        The prefix is identical for every request in static mode.
+        """
+        if self.prompt_mode == "static":
+            prefix = STATIC_PROMPT_PREFIX
+        else:
+            # Dynamically create a few-shot prompt
+            num_examples = min(len(FEW_SHOT_EXAMPLES), 2)  # Use up to 2 examples
+            selected_examples = random.sample(FEW_SHOT_EXAMPLES, num_examples)
+            prefix = f"{SYSTEM_PROMPT}\n\n{format_examples(selected_examples)}"
+        return prefix, format_sentences(sentences)
 
     def generate_batch(
         self, sentences: List[str], retry_count: int = 5, temperature: float = 0.0
     ) -> List[Dict[str, Any]]:
         """
-        Sends a batch of sentences to Gemini to get CNER tags.
+        Sends a batch of sentences to Gemini to get CNER tags. With a response
+        cache, cached sentences are answered locally and only the rest are sent.
         Args:
             sentences (List[str]): List of raw Burmese sentences.
             retry_count (int): Number of times to retry on API failure.
@@ -58,52 +329,142 @@ class CNERGenerator:
         Returns:
             List[Dict[str, Any]]: List of processed sentence objects with entities.
         """
-        # Dynamically create a few-shot prompt
-        num_examples = min(len(FEW_SHOT_EXAMPLES), 2)  # Use up to 2 examples
-        selected_examples = random.sample(FEW_SHOT_EXAMPLES, num_examples)
-
-        few_shot_prompt = "Here are some examples of how to format the output:\n\n"
-        for ex in selected_examples:
-            few_shot_prompt += f"Input:\n{ex['input']}\n\nOutput:\n{json.dumps(ex['output'], ensure_ascii=False, indent=2)}\n\n"
-
-        # Construct the user prompt with the batch of sentences
-        user_prompt = "Please process the following sentences and return the JSON object with the 'sentences' key:\n\n"
-        for i, sent in enumerate(sentences):
-            user_prompt += f"{i+1}. {sent}\n"
-
-        full_prompt = f"{SYSTEM_PROMPT}\n\n{few_shot_prompt}{user_prompt}"
+        if not self.response_cache:
+            parts = self._request_with_split(sentences, retry_count, temperature)
+            return [result for _, _, results in parts for result in results]
+
+        prompt_version = f"{PROMPT_VERSION}-{self.prompt_mode}"
+        keys = [cache_key(self.model_name, prompt_version, temperature, sentence) for sentence in sentences]
+        cached = {}
+        for i, key in enumerate(keys):
+            result = self.response_cache.get(key)
+            if result is not MISS:
+                cached[i] = result
+        missing = [i for i in range(len(sentences)) if i not in cached]
+
+        fetched = {}
+        unmatched = []
+        if missing:
+            missing_sentences = [sentences[i] for i in missing]
+            # Align each successful part on its own, so sentences lost in a failed part are not cached.
+            # Only matched sentences are cached; the rest are requested again on the next run.
+            for start, end, results in self._request_with_split(missing_sentences, retry_count, temperature):
+                aligned = align_results(missing_sentences[start:end], results)
+                for j, result in aligned.items():
+                    fetched[missing[start + j]] = result
+                    self.response_cache.put(keys[missing[start + j]], result)
+                matched = {id(result) for result in aligned.values()}
+                unmatched += [result for result in results if id(result) not in matched]
+        self.response_cache.flush()
+
+        # Results in input order; any the cache could not place go last
+        ordered = [cached.get(i, fetched.get(i)) for i in range(len(sentences))]
+        return [result for result in ordered if result is not None] + unmatched
+
+    def _request_with_split(
+        self, sentences: List[str], retry_count: int = 5, temperature: float = 0.0, start: int = 0
+    ) -> List[tuple]:
+        """
+        Requests annotations for a batch, bisecting it recursively whenever the
+        answer is malformed or truncated, so a bad sentence or an overlong
+        answer only costs the sentences it is packed with at the end. Returns
+        (start, end, results) for every part that succeeded, with start/end
+        indexing `sentences`. API failures raise APIUnavailableError instead.
+        """
+        results, complete = self._request_annotations(sentences, retry_count, temperature)
+        if results is not None and (complete or len(sentences) == 1):
+            return [(start, start + len(sentences), results)]
+        if results is not None:
+            # A truncated answer: keep the sentences salvaged from it and request the rest again
+            aligned = align_results(sentences, results)
+            covered = max(aligned) + 1 if aligned else 0
+            if covered == len(sentences):
+                return [(start, start + covered, results)]
+            if covered:
+                self.batch_state.split = True
+                return [(start, start + covered, results)] + self._request_with_split(
+                    sentences[covered:], retry_count, temperature, start + covered
+                )
+        if len(sentences) == 1:
+            console.log(f"[bold red]Giving up on sentence: {sentences[0]}[/bold red]")
+            with self.token_usage_lock:
+                self.lost_sentences += 1
+            return []
+
+        self.batch_state.split = True
+        with self.token_usage_lock:
+            self.split_count += 1
+        mid = len(sentences) // 2
+        console.log(f"[yellow]Splitting a failed batch of {len(sentences)} sentences in two.[/yellow]")
+        return self._request_with_split(sentences[:mid], retry_count, temperature, start) + self._request_with_split(
+            sentences[mid:], retry_count, temperature, start + mid
+        )
+
+    def _request_annotations(
+        self, sentences: List[str], retry_count: int = 5, temperature: float = 0.0
+    ) -> tuple:
+        """
+        Makes the extraction call for a batch. Transient API errors are
+        retried; a truncated, malformed or rejected request for several
+        sentences is not, since the caller splits the batch instead. Complete
+        sentence objects are salvaged from a damaged answer. Returns
+        (results, complete), or (None, False) if the answer was unusable.
+        Raises APIUnavailableError if the API itself kept failing.
+        """
+        prefix, user_prompt = self._build_prompt(sentences)
+        last_error = None
 
         for attempt in range(retry_count):
+            cache_name = None
             try:
-                response = self.client.models.generate_content(
-                    model=self.model_name,
-                    contents=[full_prompt],
-                    config=types.GenerateContentConfig(
-                        temperature=temperature,
-                        response_mime_type="application/json",
+                cache_name = self._get_context_cache()
+                if cache_name:
+                    response = self._call_model(
+                        user_prompt, temperature=temperature, cached_content=cache_name, response_schema=RESPONSE_SCHEMA
                     )
-                )
-
-                clean_text = _strip_markdown(response.text)
-                data = json.loads(clean_text)
-
-                if "sentences" in data and isinstance(data["sentences"], list):
-                    return data["sentences"]
                 else:
-                    console.log(f"[bold yellow]Warning: Unexpected JSON structure: {data.keys()}[/bold yellow]")
-                    return []
+                    response = self._call_model(prefix + user_prompt, temperature=temperature, response_schema=RESPONSE_SCHEMA)
+
+                if not response.text:
+                    # Blocked or empty answers carry no text at all
+                    raise ValueError("Empty response")
+                results, complete = salvage_array(response.text, "sentences", required=("text", "entities"))
+                if not complete:
+                    usage = getattr(response, "usage_metadata", None)
+                    with self.token_usage_lock:
+                        self.salvage_stats["damaged_responses"] += 1
+                        # Output of an answer that was at best partly usable; its missing part is requested again
+                        self.salvage_stats["wasted_tokens"] += getattr(usage, "candidates_token_count", None) or 0
+                        if results:
+                            self.salvage_stats["salvaged_responses"] += 1
+                            self.salvage_stats["salvaged_sentences"] += len(results)
+                    if not results:
+                        raise ValueError("Truncated or malformed JSON response with no complete sentence")
+                    console.log(f"[yellow]Salvaged {len(results)} sentences from a truncated or malformed response.[/yellow]")
+                return results, complete
 
             except Exception as e:
                 console.log(f"[bold red]API Error (Attempt {attempt+1}/{retry_count}): {e}[/bold red]")
-                if "429" in str(e) or "503" in str(e) or "SSL" in str(e):
-                    sleep_time = 15 * (attempt + 1)  # Exponential backoff
-                    console.log(f"Rate limit or server error. Sleeping for {sleep_time}s...")
-                    time.sleep(sleep_time)
-                else:
-                    time.sleep(2)
-
-        console.log("[bold red]Failed to process batch after retries.[/bold red]")
-        return []
+                last_error = e
+                if cache_name and _is_not_found(e):
+                    # The cache expired or was deleted; recreate it on the next attempt
+                    with self.context_cache_lock:
+                        if self.context_cache_name == cache_name:
+                            self.context_cache_name = None
+                    continue
+                if not is_retryable(e):
+                    # A bad answer or a rejected request: backing off will not help
+                    if len(sentences) > 1 or not isinstance(e, ValueError):
+                        return None, False
+                    continue
+                if attempt + 1 < retry_count:
+                    sleep_time = self.rate_limiter.backoff(attempt, e)
+                    console.log(f"Rate limit or server error. Slept for {sleep_time:.1f}s.")
+
+        if isinstance(last_error, ValueError):
+            console.log("[bold red]No usable answer after retries.[/bold red]")
+            return None, False
+        raise APIUnavailableError(f"API request failed after {retry_count} attempts: {last_error}") from last_error
 
     def validate_and_correct_batch(
         self,
@@ -111,141 +472,295 @@ class CNERGenerator:
         taxonomy: set,
         max_correction_loops: int = 5,
         retry_count: int = 3,
+        correction_batch_size: int = 25,
     ) -> List[Dict[str, Any]]:
         """
         Validates and corrects entities in a batch, looping until all are valid.
+        Trivial label problems are repaired locally first (see LabelRepairer).
+        All sentences still invalid are sent together, up to
+        correction_batch_size per request, and the corrections are merged back
+        by index. Later loops only rescan the entries that were sent.
         """
         corrected_results = list(results)  # Create a mutable copy
+        to_check = range(len(corrected_results))
 
         for loop_num in range(max_correction_loops):
-            invalid_entities_found = False
-            
             # Find entries that need correction
             entries_to_correct = []
-            for i, result in enumerate(corrected_results):
-                invalid_objects = []
-                if "entities" in result and isinstance(result["entities"], list):
-                    for entity in result["entities"]:
-                        if "label" in entity and entity["label"] not in taxonomy:
-                            invalid_objects.append(entity)
-                
+            for i in to_check:
+                needed_correction = bool(_invalid_entities(corrected_results[i], taxonomy))
+                corrected_results[i] = self.label_repairer.repair(corrected_results[i], taxonomy)
+                invalid_objects = _invalid_entities(corrected_results[i], taxonomy)
+                if needed_correction and not invalid_objects:
+                    self.label_repairer.record_saved_call()
                 if invalid_objects:
-                    entries_to_correct.append((i, result, invalid_objects))
-                    invalid_entities_found = True
+                    entries_to_correct.append((i, corrected_results[i], invalid_objects))
 
-            if not invalid_entities_found:
+            if not entries_to_correct:
                 console.log(f"[bold green]Validation loop {loop_num+1}: No invalid entities found. Batch is clean.[/bold green]")
                 break  # Exit the loop if the batch is clean
 
             console.log(f"[bold yellow]Validation loop {loop_num+1}: Found {len(entries_to_correct)} sentences with invalid entities. Correcting...[/bold yellow]")
 
-            for idx, result, invalid_objs in entries_to_correct:
-                prompt = (
-                    f"{VALIDATION_PROMPT}\n\n"
-                    f"The following objects in 'entities' were found to be incorrect. Please correct them.\n\n"
-                    f"Wrongful Objects:\n{json.dumps(invalid_objs, ensure_ascii=False, indent=2)}\n\n"
-                    f"Original Sentence: {result['text']}\n\n"
-                    f"Full Original JSON:\n{json.dumps(result, ensure_ascii=False, indent=2)}"
-                )
-
-                for attempt in range(retry_count):
-                    try:
-                        response = self.client.models.generate_content(
-                            model=self.model_name,
-                            contents=[prompt],
-                            config=types.GenerateContentConfig(
-                                temperature=0.0,
-                                response_mime_type="application/json",
-                            )
-                        )
-                        clean_text = _strip_markdown(response.text)
-                        data = json.loads(clean_text)
-                        corrected_results[idx] = data  # Update the result in the list
-                        break
-                    except Exception as e:
-                        console.log(f"[bold red]Correction Error (Attempt {attempt+1}/{retry_count}): {e}[/bold red]")
-                        time.sleep(2)
-                else:
-                    console.log(f"[bold red]Failed to correct result after retries: {result['text']}[/bold red]")
-                    # Keep the last known version if correction fails
+            for start in range(0, len(entries_to_correct), correction_batch_size):
+                chunk = entries_to_correct[start : start + correction_batch_size]
+                corrections = self._correct_entries(chunk, taxonomy, retry_count)
+                for idx, result, _ in chunk:
+                    entities = corrections.get(idx)
+                    if entities is None:
+                        # Keep the last known version if correction fails
+                        console.log(f"[bold red]Failed to correct result after retries: {result['text']}[/bold red]")
+                    else:
+                        corrected_results[idx] = {**result, "entities": entities}
+
+            # Entries that were never invalid cannot have changed
+            to_check = [idx for idx, _, _ in entries_to_correct]
         else:
              console.log(f"[bold red]Exceeded max validation loops ({max_correction_loops}). Some invalid entities may remain.[/bold red]")
 
 
         return corrected_results
 
-    def process_file(self, input_file: str, output_file: str, batch_size: int = 50, progress: Optional[Progress] = None, skip_sentences: set = set()):
+    def _correct_entries(self, entries: List[tuple], taxonomy: set, retry_count: int = 3) -> Dict[int, List[Dict[str, Any]]]:
         """
-        Reads a file of sentences, processes them in batches, and saves to JSONL.
+        Sends (index, result, invalid_entities) entries to Gemini in one
+        request and returns the corrected entity lists by index. Entries
+        missing from the response are left out.
         """
-        try:
-            with open(input_file, "r", encoding="utf-8") as f:
-                all_sentences = [line.strip() for line in f if line.strip()]
-                
-            if skip_sentences:
-                sentences = [s for s in all_sentences if s not in skip_sentences]
-                console.log(f"Skipping {len(all_sentences) - len(sentences)} already processed sentences.")
-            else:
-                sentences = all_sentences
-
-        except FileNotFoundError:
+        payload = [
+            {"index": idx, "text": result["text"], "entities": result["entities"], "invalid_entities": invalid_objs}
+            for idx, result, invalid_objs in entries
+        ]
+        prompt = (
+            f"{VALIDATION_PROMPT}\n{BATCH_CORRECTION_PROMPT}\n"
+            f"Allowed labels: {', '.join(sorted(taxonomy))}\n\n"
+            f"Entries:\n{json.dumps(payload, ensure_ascii=False, indent=2)}"
+        )
+        expected = {idx for idx, _, _ in entries}
+
+        for attempt in range(retry_count):
+            try:
+                response = self._call_model(prompt, response_schema=CORRECTION_RESPONSE_SCHEMA)
+                items, complete = salvage_array(response.text or "", "corrections", required=("index", "entities"))
+                if not complete and not items:
+                    raise ValueError("Truncated or malformed correction response")
+                corrections = {}
+                for item in items:
+                    if (
+                        isinstance(item, dict)
+                        and item.get("index") in expected
+                        and isinstance(item.get("entities"), list)
+                    ):
+                        corrections[item["index"]] = item["entities"]
+                return corrections
+            except Exception as e:
+                console.log(f"[bold red]Correction Error (Attempt {attempt+1}/{retry_count}): {e}[/bold red]")
+                if attempt + 1 < retry_count:
+                    self.rate_limiter.backoff(attempt, e)
+        return {}
+
+    def process_batch(
+        self,
+        batch: List[str],
+        taxonomy: set,
+        batch_num: int,
+        total_batches: Optional[int] = None,
+        log_console: Console = console,
+        budget: Optional[AdaptiveBatchBudget] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Runs extraction and the validation/correction loop for one batch.
+        With a budget, the extraction's size, latency and whether it had to be
+        split are fed back to it.
+        """
+        batch_label = f"{batch_num}/{total_batches}" if total_batches else f"{batch_num}"
+        log_console.log(f"Processing batch {batch_label}...")
+
+        # First Pass: Extraction
+        self.batch_state.split = False
+        started = time.perf_counter()
+        initial_results = self.generate_batch(batch)
+        if budget:
+            budget.record(len(batch), time.perf_counter() - started, failed=self.batch_state.split)
+
+        # Second Pass: Validation and Correction Loop
+        log_console.log(f"Validating and correcting batch {batch_label}...")
+        return self.validate_and_correct_batch(initial_results, taxonomy)
+
+    def _write_results(self, final_results: List[Dict[str, Any]], outfile, batch_num: int, log_console: Console = console):
+        """
+        Writes the kept results of a batch to the binary output file and makes
+        them durable before the checkpoint moves past the batch.
+        """
+        skipped_count = 0
+
+        if final_results:
+            lines = []
+            for result in final_results:
+                if isinstance(result, dict) and result.get("entities"):
+                    lines.append(json.dumps(result, ensure_ascii=False) + "\n")
+                else:
+                    skipped_count += 1
+            outfile.write("".join(lines).encode("utf-8"))
+            if skipped_count > 0:
+                log_console.log(f"[yellow]Skipped {skipped_count} non-sentence or empty results in batch {batch_num}.[/yellow]")
+        else:
+            log_console.log(f"[yellow]Batch {batch_num} failed or returned no results.[/yellow]")
+        outfile.flush()
+        os.fsync(outfile.fileno())
+
+    def process_file(
+        self,
+        input_file: str,
+        output_file: str,
+        batch_size: int = 50,
+        progress: Optional[Progress] = None,
+        skip_sentences: set = set(),
+        concurrency: int = 1,
+        token_budget: Optional[AdaptiveBatchBudget] = None,
+    ):
+        """
+        Streams a file of sentences in batches and appends the results to JSONL.
+        After every batch the output is fsynced and a checkpoint next to it
+        (output_file + CHECKPOINT_SUFFIX) records how far the input and output
+        got. A rerun seeks straight to the checkpoint and discards anything
+        written after it, such as a torn last line.
+        Args:
+            skip_sentences (set): Sentences to leave out, e.g. ones found in output
+                written before checkpoints existed.
+            concurrency (int): Maximum number of batches processed at once. Batches
+                run on a thread pool, but results are always appended to the output
+                in input order.
+            token_budget (AdaptiveBatchBudget): Pack batches by estimated tokens
+                (still capped at batch_size sentences) with a self-tuning budget.
+                Without one, every batch has batch_size sentences.
+        """
+        if not os.path.exists(input_file):
             console.log(f"[bold red]Input file not found: {input_file}[/bold red]")
             return
 
-        console.log(f"Loaded {len(sentences)} lines from {input_file}")
-
         output_dir = os.path.dirname(output_file)
         if output_dir and not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        total_batches = (len(sentences) + batch_size - 1) // batch_size
+        checkpoint_path = output_file + CHECKPOINT_SUFFIX
+        checkpoint = _load_checkpoint(checkpoint_path)
+        if checkpoint is None:
+            checkpoint = {
+                "input_file": os.path.abspath(input_file),
+                "input_offset": 0,
+                "output_offset": os.path.getsize(output_file) if os.path.exists(output_file) else 0,
+                "batches_done": 0,
+                "sentences_done": 0,
+            }
+        elif checkpoint["input_file"] != os.path.abspath(input_file):
+            console.log(
+                f"[bold red]{checkpoint_path} belongs to {checkpoint['input_file']}; "
+                f"remove it or choose another output file.[/bold red]"
+            )
+            return
+        else:
+            console.log(
+                f"Resuming after batch {checkpoint['batches_done']} "
+                f"({checkpoint['sentences_done']} sentences, input byte {checkpoint['input_offset']})."
+            )
+
+        input_size = os.path.getsize(input_file)
         console.log(f"Starting processing. Output will be streamed to {output_file}")
 
         task = None
         if progress:
-            task = progress.add_task("[cyan]Processing...", total=total_batches)
+            task = progress.add_task("[cyan]Processing...", total=input_size, completed=checkpoint["input_offset"])
             # Use the progress console for logging to avoid breaking the layout
             log_console = progress.console
         else:
             log_console = console
-        
-        taxonomy = {
-            "PER", "LOC", "ORG", "DATE", "NUM", "ROLE", "EVENT", "LAW", "THEORY",
-            "GROUP", "FOOD", "FIELD", "LANGUAGE", "ART", "ARTIFACT", "SUBSTANCE",
-            "DISEASE", "MONEY"
-        }
-
-        for i in range(0, len(sentences), batch_size):
-            batch_num = i // batch_size + 1
-            batch = sentences[i : i + batch_size]
-            log_console.log(f"Processing batch {batch_num}/{total_batches}...")
-
-            # First Pass: Extraction
-            initial_results = self.generate_batch(batch)
-            
-            # Second Pass: Validation and Correction Loop
-            log_console.log(f"Validating and correcting batch {batch_num}/{total_batches}...")
-            final_results = self.validate_and_correct_batch(initial_results, taxonomy)
-
-            
-            skipped_count = 0
-
-            if final_results:
-                with open(output_file, "a", encoding="utf-8") as f:
-                    for result in final_results:
-                        if isinstance(result, dict) and result.get("entities"):
-                            f.write(json.dumps(result, ensure_ascii=False) + "\n")
-                        else:
-                            skipped_count += 1
-                if skipped_count > 0:
-                    log_console.log(f"[yellow]Skipped {skipped_count} non-sentence or empty results in batch {batch_num}.[/yellow]")
-            else:
-                log_console.log(f"[yellow]Batch {batch_num} failed or returned no results.[/yellow]")
-            
-            if progress and task is not None:
-                progress.update(task, advance=1)
-
-        console.log(f"Processing complete. Data saved to {output_file}")
+
+        taxonomy = TAXONOMY
+
+        concurrency = max(1, concurrency)
+        # Finished batches wait here until every earlier batch has been written,
+        # so a slow batch holds back at most this many later ones
+        max_in_flight = concurrency * 2
+        in_flight = deque()
+
+        with open(output_file, "ab") as outfile:
+            # Drop whatever was written after the last checkpoint
+            outfile.truncate(checkpoint["output_offset"])
+            # truncate() leaves the position at the old end, which tell() would report
+            outfile.seek(0, os.SEEK_END)
+
+            def write_oldest():
+                batch_num, future, input_offset, sentence_count = in_flight.popleft()
+                self._write_results(future.result(), outfile, batch_num, log_console)
+                checkpoint["input_offset"] = input_offset
+                checkpoint["output_offset"] = outfile.tell()
+                checkpoint["batches_done"] = batch_num
+                checkpoint["sentences_done"] += sentence_count
+                self.sentences_written += sentence_count
+                _save_checkpoint(checkpoint, checkpoint_path)
+                if progress and task is not None:
+                    progress.update(task, completed=input_offset)
+
+            batches = iter_batches(input_file, batch_size, checkpoint["input_offset"], skip_sentences, token_budget)
+            try:
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    try:
+                        for batch_num, (batch, input_offset) in enumerate(batches, checkpoint["batches_done"] + 1):
+                            if len(in_flight) >= max_in_flight:
+                                write_oldest()
+                            future = executor.submit(
+                                self.process_batch, batch, taxonomy, batch_num, None, log_console, token_budget
+                            )
+                            in_flight.append((batch_num, future, input_offset, len(batch)))
+                        while in_flight:
+                            write_oldest()
+                    except BaseException:
+                        # Do not start batches that can no longer be written
+                        for _, future, _, _ in in_flight:
+                            future.cancel()
+                        raise
+            except APIUnavailableError as e:
+                console.log(
+                    f"[bold red]Stopping: {e}. The checkpoint is at batch {checkpoint['batches_done']}; "
+                    f"rerun to resume from there.[/bold red]"
+                )
+                raise
+            finally:
+                self.close_context_cache()
+                self.close_metrics()
+
+        console.log(self.label_repairer.report())
+        if self.salvage_stats["damaged_responses"]:
+            console.log(
+                f"Salvaged {self.salvage_stats['salvaged_sentences']} sentences from "
+                f"{self.salvage_stats['salvaged_responses']} of {self.salvage_stats['damaged_responses']} "
+                f"truncated or malformed responses "
+                f"({self.salvage_stats['salvaged_responses'] / self.salvage_stats['damaged_responses']:.1%} salvage rate)"
+            )
+        if self.split_count or token_budget:
+            console.log(
+                f"Split {self.split_count} failed batches, lost {self.lost_sentences} sentences"
+                + (f"; final token budget {token_budget.tokens}" if token_budget else "")
+            )
+        if self.token_usage["prompt"]:
+            console.log(
+                f"Input tokens: {self.token_usage['prompt']}, of which {self.token_usage['cached']} cached "
+                f"({self.token_usage['cached'] / self.token_usage['prompt']:.1%}); output tokens: {self.token_usage['output']}"
+                + (f" plus {self.token_usage['thoughts']} thinking" if self.token_usage["thoughts"] else "")
+            )
+        if self.response_cache:
+            cache_stats = self.response_cache.stats()
+            console.log(
+                f"Response cache: {cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']} sentences "
+                f"answered locally ({cache_stats['hit_rate']:.1%}), {cache_stats['evicted']} evicted"
+            )
+        stats = self.rate_limiter.stats()
+        console.log(
+            f"Processing complete. Data saved to {output_file} "
+            f"({stats['requests']} requests, {stats['rate_limited']} rate limited, "
+            f"{stats['retries']} retries, {stats['waited_seconds']:.0f}s spent waiting)"
+        )
 
 
 if __name__ == "__main__":
@@ -254,8 +769,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate CNER annotations using the Gemini API.")
     parser.add_argument("input_file", help="Path to the input text file (one sentence per line).")
     parser.add_argument("output_file", help="Path to the output JSONL file.")
-    parser.add_argument("--batch_size", type=int, default=50, help="Number of sentences to process in each batch.")
+    parser.add_argument("--batch_size", type=int, default=200, help="Maximum number of sentences in each batch.")
+    parser.add_argument("--token_budget", type=int, default=8000, help="Initial estimated tokens per batch, tuned during the run (0 for fixed-size batches).")
     parser.add_argument("--model_name", type=str, default="gemini-2.5-flash", help="The Gemini model to use.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of batches to process at once.")
+    parser.add_argument("--cache_path", type=str, default="data/response_cache.sqlite3", help="On-disk response cache ('' to disable).")
+    parser.add_argument("--cache_size_mb", type=int, default=512, help="Maximum size of the response cache.")
+    parser.add_argument("--prompt_mode", choices=PROMPT_MODES, default="random", help="Randomly sampled or all (fixed, cacheable) few-shot examples.")
+    parser.add_argument("--no_context_cache", action="store_true", help="In static mode, send the full prompt instead of using a Gemini context cache.")
+    parser.add_argument("--rpm", type=float, default=DEFAULT_RPM, help="Requests per minute allowed by your quota.")
+    parser.add_argument("--tpm", type=float, default=DEFAULT_TPM, help="Tokens per minute allowed by your quota.")
+    parser.add_argument("--metrics_path", type=str, default="", help="JSONL file for per-call latency and token usage ('' to disable).")
     args = parser.parse_args()
 
     if not os.environ.get("GEMINI_API_KEY"):
@@ -268,8 +792,10 @@ if __name__ == "__main__":
             console.log(f"Created output directory: {output_dir}")
 
         # --- Resume Logic ---
+        # Runs resume from their checkpoint; output from before checkpoints
+        # existed is scanned once for the sentences it already contains
         processed_sentences = set()
-        if os.path.exists(args.output_file):
+        if os.path.exists(args.output_file) and not os.path.exists(args.output_file + CHECKPOINT_SUFFIX):
             try:
                 with open(args.output_file, 'r', encoding='utf-8') as f:
                     for line in f:
@@ -285,7 +811,21 @@ if __name__ == "__main__":
                 console.log(f"[bold red]Could not read existing output file to resume: {e}[/bold red]")
 
 
-        generator = CNERGenerator(model_name=args.model_name)
+        response_cache = None
+        if args.cache_path:
+            cache_dir = os.path.dirname(args.cache_path)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            response_cache = ResponseCache(args.cache_path, max_bytes=args.cache_size_mb * 1024 * 1024)
+
+        generator = CNERGenerator(
+            model_name=args.model_name,
+            rate_limiter=RateLimiter(rpm=args.rpm, tpm=args.tpm),
+            response_cache=response_cache,
+            prompt_mode=args.prompt_mode,
+            context_cache=not args.no_context_cache,
+            metrics_path=args.metrics_path or None,
+        )
         
         with Progress() as progress:
             generator.process_file(
@@ -293,5 +833,7 @@ if __name__ == "__main__":
                 args.output_file, 
                 batch_size=args.batch_size, 
                 progress=progress,
-                skip_sentences=processed_sentences
+                skip_sentences=processed_sentences,
+                concurrency=args.concurrency,
+                token_budget=AdaptiveBatchBudget(initial=args.token_budget) if args.token_budget else None,
             )
@@ -0,0 +1,81 @@
+"""
+Recovery of complete objects from truncated or partly malformed JSON responses.
+"""
+
+import json
+import re
+from typing import Any, List, Tuple
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE_OR_COMMA = re.compile(r"[\s,]*")
+# Start of the next object in the array, used to resynchronize after a malformed one
+_NEXT_OBJECT = re.compile(r"\{\s*\"")
+
+
+def strip_markdown(text: str) -> str:
+    """Removes markdown code block formatting from a string."""
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+def salvage_array(text: str, key: str, required: Tuple[str, ...] = ()) -> Tuple[List[Any], bool]:
+    """
+    Parses a JSON response of the form {key: [object, ...]} (or a bare
+    array). Returns (objects, complete): with a well-formed response, the
+    whole list and True. Otherwise the objects are decoded one at a time
+    with raw_decode, skipping past any that are malformed, and every
+    complete object with all `required` keys is returned with False.
+    """
+    text = strip_markdown(text)
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    else:
+        if isinstance(data, dict) and isinstance(data.get(key), list):
+            return data[key], True
+        if isinstance(data, list):
+            return data, True
+        raise ValueError(f"Unexpected JSON structure: {list(data) if isinstance(data, dict) else type(data).__name__}")
+
+    match = re.search(r"\"" + re.escape(key) + r"\"\s*:\s*\[", text)
+    if match:
+        position = match.end()
+    elif text.startswith("["):
+        position = 1
+    else:
+        return [], False
+
+    objects = []
+    # After skipping a damaged object we may land inside a nested one, so a
+    # closing bracket no longer proves the array has ended
+    resynced = False
+    while position < len(text):
+        position = _WHITESPACE_OR_COMMA.match(text, position).end()
+        if position >= len(text):
+            break
+        if text[position] != "{":
+            if not resynced and text[position] == "]":
+                break
+            obj = None
+        else:
+            try:
+                obj, position = _DECODER.raw_decode(text, position)
+            except json.JSONDecodeError:
+                obj = None
+        if obj is None:
+            # Skip the damaged part and carry on from the next object, if any
+            next_object = _NEXT_OBJECT.search(text, position + 1)
+            if not next_object:
+                break
+            position = next_object.start()
+            resynced = True
+            continue
+        if isinstance(obj, dict) and all(k in obj for k in required):
+            objects.append(obj)
+            resynced = False
+    return objects, False
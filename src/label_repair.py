@@ -0,0 +1,141 @@
+"""
+Local, deterministic repair of entity labels, run before any LLM correction.
+"""
+
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Add the parent directory to sys.path to allow importing from src
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.prompts import CNER_TAGS, LABEL_ALIASES
+
+# The labels an entity may carry; "O" marks a non-entity and is never kept
+TAXONOMY = set(CNER_TAGS) - {"O"}
+
+_BIO_PREFIX = re.compile(r"^[BIES][-_]")
+_SEPARATORS = re.compile(r"[\s\-]+")
+
+
+class LabelRepairer:
+    """
+    Fixes the trivial taxonomy violations in model output without an API
+    call: stray whitespace, lowercase labels, BIO prefixes and known aliases
+    ("PERSON" -> "PER"). Entities labelled "O", malformed entities, exact
+    duplicates and entities whose text is not in the sentence are dropped.
+    Each rule that fires is counted, so its savings can be reported.
+    """
+
+    def __init__(self, aliases: Optional[Dict[str, str]] = None):
+        self.aliases = LABEL_ALIASES if aliases is None else aliases
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def repair_label(self, label: str, taxonomy: set) -> Tuple[str, List[str]]:
+        """
+        Returns the taxonomy tag (or "O") for a label and the rules that got it
+        there. A label no rule can repair is returned unchanged with no rules.
+        """
+        if label in taxonomy:
+            return label, []
+        rules = []
+        candidate = label.strip()
+        if candidate != label:
+            rules.append("whitespace")
+        if candidate.upper() != candidate:
+            rules.append("case")
+            candidate = candidate.upper()
+        if candidate not in taxonomy and candidate != "O":
+            unprefixed = _BIO_PREFIX.sub("", candidate)
+            if unprefixed != candidate:
+                rules.append("bio_prefix")
+                candidate = unprefixed
+        if candidate not in taxonomy and candidate != "O":
+            alias = self.aliases.get(_SEPARATORS.sub("_", candidate))
+            if alias:
+                rules.append("alias")
+                candidate = alias
+        if candidate in taxonomy or candidate == "O":
+            return candidate, rules
+        return label, []
+
+    def repair(self, result: Dict[str, Any], taxonomy: set = TAXONOMY) -> Dict[str, Any]:
+        """
+        Returns a repaired copy of one sentence result ({"text", "entities"}).
+        """
+        if not isinstance(result, dict) or not isinstance(result.get("entities"), list):
+            return result
+        sentence = result.get("text") or ""
+        fired = Counter()
+        entities: List[Dict[str, Any]] = []
+        seen = set()
+        for entity in result["entities"]:
+            if not isinstance(entity, dict) or not isinstance(entity.get("text"), str) or not isinstance(entity.get("label"), str):
+                fired["dropped_malformed"] += 1
+                continue
+            label, rules = self.repair_label(entity["label"], taxonomy)
+            fired.update(rules)
+            if label == "O":
+                fired["dropped_outside"] += 1
+                continue
+            text = entity["text"]
+            if text.strip() != text and text.strip():
+                fired["entity_text_trimmed"] += 1
+                text = text.strip()
+            if text not in sentence:
+                fired["dropped_not_in_sentence"] += 1
+                continue
+            if (text, label) in seen:
+                fired["dropped_duplicate"] += 1
+                continue
+            seen.add((text, label))
+            entities.append({**entity, "text": text, "label": label})
+
+        if fired:
+            with self.lock:
+                self.counts.update(fired)
+                self.counts["sentences_repaired"] += 1
+        return {**result, "entities": entities}
+
+    def record_saved_call(self, sentences: int = 1):
+        """
+        Counts sentences that had invalid labels and were fully fixed locally.
+        """
+        with self.lock:
+            self.counts["sentences_fixed_locally"] += sentences
+
+    def report(self) -> str:
+        if not self.counts:
+            return "Label repair: nothing to repair"
+        rules = ", ".join(
+            f"{rule}={count}" for rule, count in sorted(self.counts.items())
+            if rule not in ("sentences_repaired", "sentences_fixed_locally")
+        )
+        return (
+            f"Label repair: {self.counts['sentences_repaired']} sentences repaired, "
+            f"{self.counts['sentences_fixed_locally']} fixed without a correction call ({rules})"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Repair the entity labels of an annotated JSONL file offline.")
+    parser.add_argument("input_file", help="Path to the annotated JSONL file.")
+    parser.add_argument("output_file", help="Path to the repaired JSONL file.")
+    args = parser.parse_args()
+
+    repairer = LabelRepairer()
+    with open(args.input_file, "r", encoding="utf-8") as infile, open(args.output_file, "w", encoding="utf-8") as outfile:
+        for line in infile:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            outfile.write(json.dumps(repairer.repair(result), ensure_ascii=False) + "\n")
+    print(repairer.report())
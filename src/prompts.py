@@ -2,6 +2,9 @@
 This module contains the core prompts for the CNER task.
 """
 
+import hashlib
+import json
+
 # This definition remains unchanged as it defines the core schema.
 CNER_TAGS = [
     "PER", "LOC", "ORG", "DATE", "NUM",       # Group 1: Core
@@ -178,3 +181,129 @@ You are a meticulous CNER (Concept and Named Entity Recognition) Validation and
 - Use the official 18-class taxonomy provided in the initial system prompt. Do not invent new labels.
 - Be relentless in finding missing entities. Your goal is to achieve 100% recall.
 """
+
+# Appended to VALIDATION_PROMPT when several sentences are corrected in one request
+BATCH_CORRECTION_PROMPT = """
+**Batch Mode:**
+
+You will receive a JSON list of entries. Each entry has an `index`, the original `text`, its current `entities`, and the `invalid_entities` whose labels are not in the taxonomy. Correct every entry following the process above.
+
+Return ONLY a JSON object with a "corrections" key: a list with one object per entry, each with the entry's `index` (unchanged), its original `text` (unchanged) and the corrected `entities` list.
+"""
+
+# Labels the model sometimes returns instead of a taxonomy tag, mapped to the tag.
+# Keys are uppercase with spaces and hyphens replaced by underscores.
+LABEL_ALIASES = {
+    "PERSON": "PER",
+    "PEOPLE": "PER",
+    "LOCATION": "LOC",
+    "PLACE": "LOC",
+    "GPE": "LOC",
+    "ORGANIZATION": "ORG",
+    "ORGANISATION": "ORG",
+    "TIME": "DATE",
+    "NUMBER": "NUM",
+    "CARDINAL": "NUM",
+    "QUANTITY": "NUM",
+    "TITLE": "ROLE",
+    "JOB": "ROLE",
+    "OCCUPATION": "ROLE",
+    "RELIGION": "THEORY",
+    "IDEOLOGY": "THEORY",
+    "NORP": "GROUP",
+    "ETHNIC_GROUP": "GROUP",
+    "CUISINE": "FOOD",
+    "LANG": "LANGUAGE",
+    "WORK_OF_ART": "ART",
+    "PRODUCT": "ARTIFACT",
+    "OBJECT": "ARTIFACT",
+    "MATERIAL": "SUBSTANCE",
+    "CURRENCY": "MONEY",
+    "ILLNESS": "DISEASE",
+}
+
+def format_examples(examples: list) -> str:
+    """Formats few-shot examples as the examples section of an extraction prompt."""
+    few_shot_prompt = "Here are some examples of how to format the output:\n\n"
+    for ex in examples:
+        few_shot_prompt += f"Input:\n{ex['input']}\n\nOutput:\n{json.dumps(ex['output'], ensure_ascii=False, indent=2)}\n\n"
+    return few_shot_prompt
+
+
+def format_sentences(sentences: list) -> str:
+    """Formats the numbered sentence list that ends every extraction prompt."""
+    user_prompt = "Please process the following sentences and return the JSON object with the 'sentences' key:\n\n"
+    for i, sent in enumerate(sentences):
+        user_prompt += f"{i+1}. {sent}\n"
+    return user_prompt
+
+
+# The fixed start of every extraction prompt in "static" prompt mode: the
+# system prompt and all examples, always in the same order, so that it can
+# be cached by the API
+STATIC_PROMPT_PREFIX = f"{SYSTEM_PROMPT}\n\n{format_examples(FEW_SHOT_EXAMPLES)}"
+
+
+def _prompt_version() -> str:
+    digest = hashlib.sha256()
+    digest.update(SYSTEM_PROMPT.encode("utf-8"))
+    digest.update(json.dumps(FEW_SHOT_EXAMPLES, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+# Changes whenever the extraction prompt or its examples change; part of every response cache key
+PROMPT_VERSION = _prompt_version()
+
+# Entity labels the model may produce; "O" only marks the outside of entities
+ENTITY_LABELS = [tag for tag in CNER_TAGS if tag != "O"]
+
+_ENTITY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "text": {"type": "STRING"},
+        "label": {"type": "STRING", "enum": ENTITY_LABELS},
+    },
+    "required": ["text", "label"],
+    "property_ordering": ["text", "label"],
+}
+
+# Response schema of extraction requests; the label enum rules out labels outside the taxonomy
+RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "sentences": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "text": {"type": "STRING"},
+                    "entities": {"type": "ARRAY", "items": _ENTITY_SCHEMA},
+                },
+                "required": ["text", "entities"],
+                "property_ordering": ["text", "entities"],
+            },
+        }
+    },
+    "required": ["sentences"],
+}
+
+# Response schema of batched correction requests (see BATCH_CORRECTION_PROMPT)
+CORRECTION_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "corrections": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "index": {"type": "INTEGER"},
+                    "text": {"type": "STRING"},
+                    "entities": {"type": "ARRAY", "items": _ENTITY_SCHEMA},
+                },
+                "required": ["index", "entities"],
+                "property_ordering": ["index", "text", "entities"],
+            },
+        }
+    },
+    "required": ["corrections"],
+}
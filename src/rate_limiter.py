@@ -0,0 +1,209 @@
+"""
+Client-side rate limiting and retry backoff for Gemini API calls.
+"""
+
+import random
+import re
+import threading
+import time
+from typing import Callable, Optional
+
+# Default quota; set these to the limits of your project and model tier
+DEFAULT_RPM = 60
+DEFAULT_TPM = 1_000_000
+
+# Rough characters-per-token ratio for Burmese text, used before a call's real usage is known
+CHARS_PER_TOKEN = 3
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_MARKERS = ("429", "500", "502", "503", "504", "RESOURCE_EXHAUSTED", "UNAVAILABLE", "SSL", "timed out")
+_RATE_LIMIT_MARKERS = ("429", "RESOURCE_EXHAUSTED")
+# "retryDelay': '31s'" in the RetryInfo details of a 429, or "Please retry in 31.5s." in its message
+_RETRY_DELAY = re.compile(r"retryDelay['\"]?\s*:\s*['\"]?(\d+(?:\.\d+)?)s|retry in (\d+(?:\.\d+)?)\s*(ms|s)", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, round(len(text) / CHARS_PER_TOKEN))
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    code = _status_code(exc)
+    if code is not None:
+        return code == 429
+    return any(marker in str(exc) for marker in _RATE_LIMIT_MARKERS)
+
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    Whether an API error is transient: rate limiting, server overload, or a
+    dropped connection.
+    """
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    code = _status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    return any(marker in str(exc) for marker in _RETRYABLE_MARKERS)
+
+
+def retry_after_hint(exc: Exception) -> Optional[float]:
+    """
+    Returns the number of seconds the server asked us to wait, from a
+    Retry-After header or the RetryInfo in the error body, if there is one.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    match = _RETRY_DELAY.search(str(exc))
+    if match:
+        if match.group(1):
+            return float(match.group(1))
+        seconds = float(match.group(2))
+        return seconds / 1000 if match.group(3).lower() == "ms" else seconds
+    return None
+
+
+class TokenBucket:
+    """
+    A bucket holding up to one minute of budget, refilled continuously.
+    Callers reserve what they need up front; the level may go negative, and
+    the reservation then tells the caller how long to wait for its turn.
+    """
+
+    def __init__(self, per_minute: float, now: float):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float, scale: float = 1.0) -> float:
+        """
+        Takes `amount` from the bucket and returns the seconds until it is covered.
+        """
+        rate = self.per_minute * scale / 60
+        self.level = min(self.per_minute, self.level + (now - self.updated) * rate)
+        self.updated = now
+        self.level -= amount
+        return 0.0 if self.level >= 0 else -self.level / rate
+
+    def refund(self, amount: float):
+        self.level = min(self.per_minute, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Shared requests-per-minute and tokens-per-minute limiter for all threads
+    calling the API. The allowed rate adapts AIMD style: every 429 halves it
+    (down to `min_scale` of the quota) and every success wins back a small
+    step, so the limiter settles just below the rate the server accepts.
+    Retry-after hints pause every caller, not only the one that was refused.
+
+    The clock, sleep and random source are injectable for testing.
+    """
+
+    def __init__(
+        self,
+        rpm: float = DEFAULT_RPM,
+        tpm: float = DEFAULT_TPM,
+        min_scale: float = 0.1,
+        increase: float = 0.02,
+        decrease: float = 0.5,
+        base_backoff: float = 2.0,
+        max_backoff: float = 120.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None,
+    ):
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self.min_scale = min_scale
+        self.increase = increase
+        self.decrease = decrease
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.scale = 1.0
+        self.lock = threading.Lock()
+
+        now = clock()
+        self.requests = TokenBucket(rpm, now)
+        self.tokens = TokenBucket(tpm, now)
+        self.blocked_until = now
+
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self.retry_count = 0
+        self.waited_seconds = 0.0
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Blocks until one request using about `tokens` tokens fits in the budget.
+        Returns the time spent waiting.
+        """
+        with self.lock:
+            now = self.clock()
+            wait = max(
+                self.blocked_until - now,
+                self.requests.reserve(1, now, self.scale),
+                self.tokens.reserve(tokens, now, self.scale),
+            )
+            self.request_count += 1
+            self.waited_seconds += max(0.0, wait)
+        if wait > 0:
+            self.sleep(wait)
+        return max(0.0, wait)
+
+    def on_success(self, token_correction: int = 0):
+        """
+        Records a successful call. `token_correction` is the actual token usage
+        minus the estimate passed to acquire.
+        """
+        with self.lock:
+            if token_correction > 0:
+                self.tokens.level -= token_correction
+            elif token_correction < 0:
+                self.tokens.refund(-token_correction)
+            self.scale = min(1.0, self.scale + self.increase)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        """
+        Records a 429: cuts the allowed rate and, with a hint, pauses every caller.
+        """
+        with self.lock:
+            self.rate_limited_count += 1
+            self.scale = max(self.min_scale, self.scale * self.decrease)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, self.clock() + retry_after)
+
+    def backoff(self, attempt: int, exc: Optional[Exception] = None) -> float:
+        """
+        Sleeps before retry number `attempt` (0-based) and returns the delay:
+        exponential with jitter, and never shorter than the server's hint.
+        """
+        ceiling = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+        delay = self.rng.uniform(ceiling / 2, ceiling)
+        hint = retry_after_hint(exc) if exc is not None else None
+        if hint:
+            delay = max(delay, hint)
+        with self.lock:
+            self.retry_count += 1
+            self.waited_seconds += delay
+        self.sleep(delay)
+        return delay
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.request_count,
+            "rate_limited": self.rate_limited_count,
+            "retries": self.retry_count,
+            "waited_seconds": self.waited_seconds,
+            "scale": self.scale,
+        }
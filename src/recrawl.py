@@ -0,0 +1,125 @@
+import hashlib
+import sqlite3
+from threading import Lock
+
+
+class PageUnchanged(Exception):
+    """
+    Raised when a fetch shows that a page has not changed since the last crawl.
+    """
+
+
+class ValidatorStore:
+    """
+    Remembers each crawled URL's ETag, Last-Modified header and content hash
+    in SQLite, so later crawls can send conditional requests and skip pages
+    that have not changed. Records are kept in memory for lookups and written
+    to disk in batches. The record of a changed page is only kept once the
+    crawler commits it after scraping the page, so a failed scrape is retried
+    on the next crawl.
+    """
+
+    def __init__(self, path, batch_size=500):
+        self.batch_size = batch_size
+        self.lock = Lock()
+        self.unchanged_count = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT)"
+        )
+        self.conn.commit()
+
+        self.records = {
+            url: (etag, last_modified, content_hash)
+            for url, etag, last_modified, content_hash in self.conn.execute(
+                "SELECT url, etag, last_modified, content_hash FROM pages"
+            )
+        }
+        self.dirty = {}
+        self.pending = {}
+
+    def urls(self):
+        with self.lock:
+            return list(self.records)
+
+    def request_headers(self, url):
+        """
+        Returns the conditional request headers for a previously crawled URL.
+        """
+        record = self.records.get(url)
+        if not record:
+            return {}
+        etag, last_modified, _ = record
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def check_response(self, url, status, headers, body):
+        """
+        Checks the validators of a fetched page and raises PageUnchanged if the
+        server answered 304 or the body hashes the same as on the last crawl.
+        For a changed page the new validators are held until commit(url).
+        """
+        if status >= 400:
+            return
+        if status == 304:
+            with self.lock:
+                self.unchanged_count += 1
+            raise PageUnchanged(url)
+
+        content_hash = hashlib.sha256(body).hexdigest()
+        record = (headers.get("ETag"), headers.get("Last-Modified"), content_hash)
+        with self.lock:
+            previous = self.records.get(url)
+            if previous and previous[2] == content_hash:
+                self.unchanged_count += 1
+                self._store(url, record)
+                raise PageUnchanged(url)
+            self.pending[url] = record
+
+    def commit(self, url):
+        """
+        Keeps the validators checked for a page once it has been scraped.
+        """
+        with self.lock:
+            record = self.pending.pop(url, None)
+            if record:
+                self._store(url, record)
+
+    def discard(self, url):
+        """
+        Forgets the validators checked for a page that could not be scraped.
+        """
+        with self.lock:
+            self.pending.pop(url, None)
+
+    def _store(self, url, record):
+        self.records[url] = record
+        self.dirty[url] = record
+        if len(self.dirty) >= self.batch_size:
+            self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def _flush(self):
+        if self.dirty:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash) "
+                "VALUES (?, ?, ?, ?)",
+                ((url, *record) for url, record in self.dirty.items()),
+            )
+            self.conn.commit()
+            self.dirty.clear()
@@ -0,0 +1,150 @@
+"""
+On-disk cache of per-sentence annotation results.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List
+
+# Returned by ResponseCache.get when a sentence has no cached result
+MISS = object()
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sentence(sentence: str) -> str:
+    """NFC-normalizes a sentence and collapses its whitespace."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", sentence)).strip()
+
+
+def cache_key(model_name: str, prompt_version: str, temperature: float, sentence: str) -> str:
+    material = json.dumps(
+        [model_name, prompt_version, float(temperature), normalize_sentence(sentence)], ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def align_results(sentences: List[str], results: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """
+    Matches the results of one extraction call back to the input sentences.
+    The model drops invalid sentences and strips artifacts from the rest, so
+    a result belongs to the next input whose normalized text contains the
+    result's text. Only matched inputs are returned: an input without a
+    match may have been dropped by the model or rewritten beyond
+    recognition, and the two cannot be told apart.
+    """
+    normalized = [normalize_sentence(sentence) for sentence in sentences]
+    aligned = {}
+    position = 0
+    for result in results:
+        if not isinstance(result, dict) or not isinstance(result.get("text"), str):
+            continue
+        text = normalize_sentence(result["text"])
+        if not text:
+            continue
+        for i in range(position, len(sentences)):
+            if text in normalized[i]:
+                aligned[i] = result
+                position = i + 1
+                break
+    return aligned
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache from (model, prompt version, temperature, sentence)
+    to the sentence's annotation result. Sentences without a result are not
+    cached and are requested again on the next run. Once the stored results
+    exceed max_bytes, the least recently used tenth is evicted. Safe to share
+    between threads.
+    """
+
+    def __init__(self, path: str = "data/response_cache.sqlite3", max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM responses").fetchone()[0]
+        self.touched = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get(self, key: str):
+        """
+        Returns the cached result for a key, or MISS.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return MISS
+            self.hits += 1
+            self.touched[key] = time.time()
+            return json.loads(row[0])
+
+    def put(self, key: str, result: Dict[str, Any]):
+        value = json.dumps(result, ensure_ascii=False)
+        with self.lock:
+            old = self.conn.execute("SELECT LENGTH(value) FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, last_used) VALUES (?, ?, ?)", (key, value, time.time())
+            )
+            self.size += len(value) - (old[0] if old else 0)
+            if self.size > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        self._write_touches()
+        count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        doomed = max(1, count // 10)
+        freed, deleted = self.conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(value)), 0), COUNT(*) FROM "
+            "(SELECT value FROM responses ORDER BY last_used LIMIT ?)",
+            (doomed,),
+        ).fetchone()
+        self.conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)", (doomed,)
+        )
+        self.size -= freed
+        self.evicted += deleted
+
+    def _write_touches(self):
+        if self.touched:
+            self.conn.executemany(
+                "UPDATE responses SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self.touched.items()],
+            )
+            self.touched.clear()
+
+    def flush(self):
+        with self.lock:
+            self._write_touches()
+            self.conn.commit()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evicted": self.evicted,
+            "size_bytes": self.size,
+        }
@@ -1,69 +1,192 @@
 import re
 import os
-import shutil
+import json
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from corpus_store import iter_shard, list_shards
 
 
-def sanitize_text(input_path, output_path):
+# Quotation marks removed before splitting
+QUOTE_CHARS = "“”«»„‟‘’‚‛\"'"
+# Boilerplate lines that are dropped wherever they appear
+BANNED_PHRASES = [
+    "အချိန်နှင့်တပြေးညီ သိရှိလိုပါသလား?",
+    "subscribe လုပ်ထားလိုက်ပါ။",
+    "အသေးစိတ် ပိုမိုသိရှိနိုင်ရန်",
+]
+SENTENCE_ENDINGS = ("။", ".", "?", "!")
+# Records the size and mtime of every sanitized input, to skip unchanged ones
+MANIFEST_NAME = ".manifest.json"
+
+
+class PhraseMatcher:
     """
-    Reads raw text data, sanitizes it by extracting complete sentences
-    containing Myanmar characters and being at least 15 characters long,
-    and writes the sanitized data to a new file.
+    Reports whether a text contains any of a set of phrases. The phrases are
+    compiled into one trie-shaped regular expression, so like an Aho-Corasick
+    automaton each text position walks shared prefixes once instead of testing
+    every phrase in turn, and the phrase list can grow without a per-line cost.
     """
-    try:
-        with open(input_path, "r", encoding="utf-8") as f:
-            content = f.read()
-
-        # remove various quotation marks
-        content = re.sub(r'[“”«»„‟‟‟‘’‚‛"\']', "", content)
-        # normalize multiple spaces and punctuation
-        content = re.sub(r"\s+", " ", content)
-        content = re.sub(r"\.{2,}", ".", content)
-        content = re.sub(r"\?{2,}", "?", content)
-        content = re.sub(r"!{2,}", "!", content)
-        # split into lines at sentence-ending punctuation
-        content = (
-            content.replace("။", "။\n")
+
+    def __init__(self, phrases):
+        trie = {}
+        for phrase in phrases:
+            if not phrase:
+                continue
+            node = trie
+            for ch in phrase:
+                node = node.setdefault(ch, {})
+            node[""] = {}
+        self.pattern = re.compile(self._trie_pattern(trie)) if trie else None
+
+    @classmethod
+    def _trie_pattern(cls, node):
+        # A phrase ending here already matches, so longer phrases through this node are redundant
+        if "" in node:
+            return ""
+        alternatives = [re.escape(ch) + cls._trie_pattern(child) for ch, child in sorted(node.items())]
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return "(?:" + "|".join(alternatives) + ")"
+
+    def search(self, text):
+        return self.pattern is not None and self.pattern.search(text) is not None
+
+
+class Sanitizer:
+    """
+    Extracts complete sentences containing Myanmar characters from raw text.
+    All patterns are compiled once, and text can be fed in chunks (e.g. line
+    by line) with the same result as sanitizing it in one piece.
+    """
+
+    def __init__(self, banned_phrases=BANNED_PHRASES, min_length=30):
+        self.min_length = min_length
+        self.quotes = re.compile(f"[{re.escape(QUOTE_CHARS)}]")
+        self.whitespace = re.compile(r"\s+")
+        self.repeated_punctuation = re.compile(r"([.?!])\1+")
+        self.myanmar = re.compile(r"[က-၏]")
+        self.banned = PhraseMatcher(banned_phrases)
+
+    def normalize(self, text):
+        # remove various quotation marks, then normalize multiple spaces and punctuation
+        text = self.whitespace.sub(" ", self.quotes.sub("", text))
+        return self.repeated_punctuation.sub(r"\1", text)
+
+    def split(self, text):
+        # Sentences end after ။ ? ! and after a full stop followed by a space,
+        # which is consumed. Normalized text has no other line breaks.
+        return (
+            text.replace("။", "။\n")
             .replace(". ", ".\n")
             .replace("?", "?\n")
             .replace("!", "!\n")
+            .split("\n")
         )
-        # split into lines array
-        lines = content.splitlines()
-
-        sanitized_lines = []
-        for line in lines:
-            stripped_line = line.strip()  # remove leading/trailing whitespace
-            is_burmese = (
-                re.search(r"[က-၏]", stripped_line) is not None
-            )  # check for Myanmar characters
-            is_sentence = len(stripped_line) >= 30 and (
-                stripped_line.endswith("။")
-                or stripped_line.endswith(".")
-                or stripped_line.endswith("?")
-                or stripped_line.endswith("!")
-            )  # check length and ending punctuation
-            is_banned = any(
-                banned in stripped_line
-                for banned in [
-                    "အချိန်နှင့်တပြေးညီ သိရှိလိုပါသလား?",
-                    "subscribe လုပ်ထားလိုက်ပါ။",
-                    "အသေးစိတ် ပိုမိုသိရှိနိုင်ရန်",
-                ]
-            )  # check for banned phrases
-            # Process only non-empty lines with Myanmar characters and of a certain length
-            if is_burmese and is_sentence and not is_banned:
-                sanitized_lines.append(stripped_line)
-
-        # Ensure output directory exists
-        output_dir = os.path.dirname(output_path)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        # Write the sanitized sentences to the output file
-        with open(output_path, "w", encoding="utf-8") as f:
-            for sentence in sanitized_lines:
-                f.write(sentence + "\n")
 
+    def filter(self, segments):
+        for segment in segments:
+            stripped = segment.strip()
+            # Keep long enough lines with ending punctuation, Myanmar characters and no banned phrases
+            if (
+                len(stripped) >= self.min_length
+                and stripped.endswith(SENTENCE_ENDINGS)
+                and self.myanmar.search(stripped)
+                and not self.banned.search(stripped)
+            ):
+                yield stripped
+
+    def iter_sentences(self, chunks):
+        """
+        Yields the sanitized sentences of text given as an iterable of chunks.
+        """
+        tail = ""
+        for chunk in chunks:
+            # The tail is already normalized and contains no sentence boundary,
+            # so only its last character can interact with the new chunk
+            segments = self.split(self.normalize(tail[-1:] + chunk))
+            segments[0] = tail[:-1] + segments[0]
+            tail = segments.pop()
+            yield from self.filter(segments)
+        yield from self.filter([tail])
+
+    def sanitize(self, content):
+        return list(self.iter_sentences([content]))
+
+
+DEFAULT_SANITIZER = Sanitizer()
+
+
+def sanitize_content(content):
+    """
+    Extracts the complete sentences from raw text that contain Myanmar
+    characters and are at least 30 characters long.
+    """
+    return DEFAULT_SANITIZER.sanitize(content)
+
+
+def write_sanitized(sanitized_lines, output_path):
+    """
+    Writes sentences to the output file as they arrive and returns how many
+    were written. The file is written under a temporary name and moved into
+    place at the end, so an interrupted run never leaves a partial output.
+    """
+    # Ensure output directory exists
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Write the sanitized sentences to the output file
+    count = 0
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for sentence in sanitized_lines:
+            f.write(sentence + "\n")
+            count += 1
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def iter_text_file_sentences(input_path):
+    """
+    Streams a raw .txt file line by line through the sanitizer.
+    """
+    with open(input_path, "r", encoding="utf-8") as f:
+        yield from DEFAULT_SANITIZER.iter_sentences(f)
+
+
+def iter_shard_sentences(input_path):
+    """
+    Streams the records of a raw corpus shard through the sanitizer. Records
+    are sanitized separately, so no sentence spans two articles.
+    """
+    for record in iter_shard(input_path):
+        yield from DEFAULT_SANITIZER.iter_sentences([record["text"]])
+
+
+def sanitize_text(input_path, output_path):
+    """
+    Reads raw text data, sanitizes it by extracting complete sentences
+    containing Myanmar characters and being at least 30 characters long,
+    and writes the sanitized data to a new file.
+    """
+    try:
+        write_sanitized(iter_text_file_sentences(input_path), output_path)
+        print(f"Sanitized data saved to {output_path}")
+
+    except FileNotFoundError:
+        print(f"Error: Input file not found at {input_path}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+def sanitize_shard(input_path, output_path):
+    """
+    Sanitizes every article record in a raw corpus shard and writes all of
+    their sentences to a single output file.
+    """
+    try:
+        write_sanitized(iter_shard_sentences(input_path), output_path)
         print(f"Sanitized data saved to {output_path}")
 
     except FileNotFoundError:
@@ -72,26 +195,122 @@ def sanitize_text(input_path, output_path):
         print(f"An error occurred: {e}")
 
 
-if __name__ == "__main__":
-    raw_dir = "data/raw"
-    sanitized_dir = "data/sanitized"
-
-    # Clean the sanitized directory before processing
-    if os.path.exists(sanitized_dir):
-        for filename in os.listdir(sanitized_dir):
-            file_path = os.path.join(sanitized_dir, filename)
-            try:
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.unlink(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-            except Exception as e:
-                print(f"Failed to delete {file_path}. Reason: {e}")
-    else:
-        os.makedirs(sanitized_dir)
-
-    for filename in os.listdir(raw_dir):
+def _sanitize_job(job):
+    """
+    Process pool worker: sanitizes one raw input into one output file.
+    Returns the job, the number of sentences written and an error message.
+    """
+    input_path, output_path, is_shard = job
+    try:
+        sentences = iter_shard_sentences(input_path) if is_shard else iter_text_file_sentences(input_path)
+        return job, write_sanitized(sentences, output_path), None
+    except Exception as e:
+        return job, 0, str(e)
+
+
+def _load_manifest(path):
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            pass
+    return {}
+
+
+def _save_manifest(manifest, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def sanitize_corpus(raw_dir="data/raw", sanitized_dir="data/sanitized", max_workers=None, force=False):
+    """
+    Sanitizes the whole raw corpus in parallel. Legacy .txt files map to a
+    sanitized file of the same name and each shard to one named after it.
+    Inputs whose size and mtime match the manifest from the last run are
+    skipped unless force is set, and outputs without an input are removed.
+    """
+    os.makedirs(sanitized_dir, exist_ok=True)
+    manifest_path = os.path.join(sanitized_dir, MANIFEST_NAME)
+    manifest = {} if force else _load_manifest(manifest_path)
+
+    jobs = []
+    for filename in sorted(os.listdir(raw_dir)):
         if filename.endswith(".txt"):
-            input_path = os.path.join(raw_dir, filename)
-            output_path = os.path.join(sanitized_dir, filename)
-            sanitize_text(input_path, output_path)
+            jobs.append((os.path.join(raw_dir, filename), os.path.join(sanitized_dir, filename), False))
+    # Each raw corpus shard becomes one sanitized file named after it
+    for input_path in list_shards(raw_dir):
+        shard_name = os.path.basename(input_path).split(".")[0]
+        jobs.append((input_path, os.path.join(sanitized_dir, f"{shard_name}.txt"), True))
+
+    # Remove outputs left over from inputs that no longer exist
+    expected_outputs = {os.path.basename(output_path) for _, output_path, _ in jobs}
+    for filename in os.listdir(sanitized_dir):
+        if filename.endswith(".txt") and filename not in expected_outputs:
+            os.remove(os.path.join(sanitized_dir, filename))
+    manifest = {name: entry for name, entry in manifest.items() if entry["output"] in expected_outputs}
+
+    pending = []
+    for job in jobs:
+        input_path, output_path, _ = job
+        stat = os.stat(input_path)
+        entry = manifest.get(os.path.basename(input_path))
+        if (
+            entry
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+            and os.path.exists(output_path)
+        ):
+            continue
+        pending.append((job, stat))
+
+    print(f"Sanitizing {len(pending)} of {len(jobs)} inputs ({len(jobs) - len(pending)} unchanged)")
+    if not pending:
+        _save_manifest(manifest, manifest_path)
+        return
+
+    stats = {job[0]: stat for job, stat in pending}
+    total_bytes = 0
+    total_sentences = 0
+    start_time = time.perf_counter()
+    max_workers = max_workers or multiprocessing.cpu_count()
+    chunksize = max(1, len(pending) // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(_sanitize_job, [job for job, _ in pending], chunksize=chunksize)
+        for done, ((input_path, output_path, _), count, error) in enumerate(results, 1):
+            if error:
+                print(f"An error occurred while sanitizing {input_path}: {error}")
+                continue
+            stat = stats[input_path]
+            manifest[os.path.basename(input_path)] = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "output": os.path.basename(output_path),
+            }
+            total_bytes += stat.st_size
+            total_sentences += count
+            # Save progress now and then so an interrupted run keeps finished work
+            if done % 100 == 0:
+                _save_manifest(manifest, manifest_path)
+    _save_manifest(manifest, manifest_path)
+
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"Sanitized {len(pending)} inputs into {total_sentences} sentences in {elapsed:.1f}s "
+        f"({total_bytes / 1e6 / elapsed:.2f} MB/s, {total_sentences / elapsed:.0f} sentences/s)"
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sanitize the raw corpus into sentence files.")
+    parser.add_argument("--raw_dir", type=str, default="data/raw", help="Directory of the raw corpus.")
+    parser.add_argument("--sanitized_dir", type=str, default="data/sanitized", help="Directory for the sanitized files.")
+    parser.add_argument("--max_workers", type=int, default=None, help="Number of worker processes (default: all cores).")
+    parser.add_argument("--force", action="store_true", help="Re-sanitize every input, ignoring the manifest.")
+    args = parser.parse_args()
+
+    sanitize_corpus(args.raw_dir, args.sanitized_dir, max_workers=args.max_workers, force=args.force)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+from threading import Lock
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ScrapeIndex:
+    """
+    Thread-safe index of the articles already saved to the raw corpus, keyed
+    by sanitized title, URL and content hash, so duplicate checks are constant
+    time and exact. The index is loaded once and persisted as an append-only
+    JSONL file next to the raw directory.
+    """
+
+    def __init__(self, raw_dir="data/raw", path="data/raw_index.jsonl"):
+        self.raw_dir = raw_dir
+        self.path = path
+        self.lock = Lock()
+        self.titles = set()
+        self.urls = set()
+        self.hashes = set()
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Ignore a torn last line
+                    self._remember(record)
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+
+        if os.path.isdir(raw_dir):
+            # Pick up articles from the one-file-per-article layout, where the
+            # filename is the sanitized title, and write them to the index so
+            # they stay known once the files are gone
+            for filename in sorted(os.listdir(raw_dir)):
+                title = filename[: -len(".txt")]
+                if filename.endswith(".txt") and title not in self.titles:
+                    record = {"title": title}
+                    self._remember(record)
+                    self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def _remember(self, record):
+        if record.get("title"):
+            self.titles.add(record["title"])
+        if record.get("url"):
+            self.urls.add(record["url"])
+        if record.get("content_hash"):
+            self.hashes.add(record["content_hash"])
+
+    def __len__(self):
+        return len(self.titles)
+
+    def contains(self, title=None, url=None, content_hash=None):
+        """
+        Returns True if an article with any of the given keys was already scraped.
+        """
+        with self.lock:
+            return (
+                (title is not None and title in self.titles)
+                or (url is not None and url in self.urls)
+                or (content_hash is not None and content_hash in self.hashes)
+            )
+
+    def reserve(self, title, url, content_hash):
+        """
+        Claims an article in memory before it is saved, so concurrent threads
+        never save it twice. Returns False if an article with one of the same
+        keys was already claimed or added. Follow with commit() once the
+        article is saved, or release() if saving failed.
+        """
+        with self.lock:
+            if title in self.titles or url in self.urls or content_hash in self.hashes:
+                return False
+            self._remember({"title": title, "url": url, "content_hash": content_hash})
+            return True
+
+    def commit(self, title, url, content_hash):
+        """Persists a reserved article to the index file."""
+        record = {"title": title, "url": url, "content_hash": content_hash}
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def release(self, title, url, content_hash):
+        """Drops a reservation whose article could not be saved."""
+        with self.lock:
+            self.titles.discard(title)
+            self.urls.discard(url)
+            self.hashes.discard(content_hash)
+
+    def register(self, title, url=None, content_hash=None):
+        """
+        Records whichever keys of an existing article are not known yet, e.g.
+        the content hash of an article that was only known by its title.
+        """
+        with self.lock:
+            record = {
+                key: value
+                for key, value, known in (
+                    ("title", title, self.titles),
+                    ("url", url, self.urls),
+                    ("content_hash", content_hash, self.hashes),
+                )
+                if value and value not in known
+            }
+            if record:
+                self._remember(record)
+                self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self.file.flush()
+
+    def add(self, title, url, content_hash):
+        """
+        Records an article that is already saved. Returns False without
+        recording anything if an article with one of the same keys is known.
+        """
+        if not self.reserve(title, url, content_hash):
+            return False
+        self.commit(title, url, content_hash)
+        return True
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -1,3 +1,4 @@
+import atexit
 import os
 import re
 from selenium.webdriver.support.ui import WebDriverWait
@@ -9,6 +10,9 @@ from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
 from rich.logging import RichHandler
 import logging
+from threading import Lock
+from scrape_index import ScrapeIndex, content_hash
+from corpus_store import ShardWriter
 
 # Configure logging with RichHandler
 logging.basicConfig(
@@ -20,6 +24,41 @@ logging.basicConfig(
 
 log = logging.getLogger("rich")
 
+RAW_DIR = "data/raw"
+INDEX_PATH = "data/raw_index.jsonl"
+# Raw corpus shards are rotated at this many uncompressed bytes
+RAW_SHARD_BYTES = 64 * 1024 * 1024
+RAW_COMPRESSION = "gzip"
+
+_scrape_index = None
+_scrape_index_lock = Lock()
+_corpus_writer = None
+_corpus_writer_lock = Lock()
+
+
+def get_scrape_index():
+    """
+    Returns the process-wide index of scraped articles, loading it on first use.
+    """
+    global _scrape_index
+    with _scrape_index_lock:
+        if _scrape_index is None:
+            _scrape_index = ScrapeIndex(RAW_DIR, INDEX_PATH)
+        return _scrape_index
+
+
+def get_corpus_writer():
+    """
+    Returns the process-wide raw corpus shard writer, opening it on first use.
+    """
+    global _corpus_writer
+    with _corpus_writer_lock:
+        if _corpus_writer is None:
+            _corpus_writer = ShardWriter(RAW_DIR, max_shard_bytes=RAW_SHARD_BYTES, compression=RAW_COMPRESSION)
+            # Compressed shards need their trailer written on exit
+            atexit.register(_corpus_writer.close)
+        return _corpus_writer
+
 
 def sanitize_filename(filename):
     """
@@ -28,21 +67,37 @@ def sanitize_filename(filename):
     return re.sub(r'[<>:"/\\|?*]', "_", filename)
 
 
-def scrape_page(driver, url):
+def find_article(soup):
     """
-    Scrapes a single web page using an existing Selenium driver instance
-    and saves its text content to a file if it's an article page.
+    Locates the article title tag and content container in a parsed page.
+    Either element is None if the page does not contain it.
     """
-    try:
-        soup = BeautifulSoup(driver.page_source, "lxml")
+    title_tag = soup.find("h1", class_=lambda x: x and "article" in x)
+    # Find the content container based on the provided structure
+    content = soup.select_one('div > div[style*="background-color"]')
+    return title_tag, content
 
+
+def scrape_page(soup, url, index=None, writer=None):
+    """
+    Scrapes a single parsed web page (from a plain HTTP fetch or a Selenium
+    driver's page source) and appends its text content to the raw corpus
+    shards if it's an article page. Articles already in the scrape index
+    (same title, URL or content) are skipped. Returns True once the page is
+    handled, whether it was saved or skipped, and False if an error stopped it.
+    """
+    if index is None:
+        index = get_scrape_index()
+    if writer is None:
+        writer = get_corpus_writer()
+    try:
         # Find the title to determine if it's an article page
-        title_tag = soup.find("h1", class_=lambda x: x and "article" in x)
+        title_tag, content = find_article(soup)
 
         # If there's no title tag, it's not an article, so we skip it
         if not title_tag:
             log.info(f"Skipping non-article page: {url}")
-            return
+            return True
 
         title = title_tag.get_text().strip()
         
@@ -50,32 +105,32 @@ def scrape_page(driver, url):
         truncated_title = title[:50]
         sanitized_title = sanitize_filename(truncated_title)
         
-        # Check if a file with a similar name already exists
-        raw_dir = "data/raw"
-        os.makedirs(raw_dir, exist_ok=True)
-        
-        # Check for existing files starting with the sanitized title
-        if any(f.startswith(sanitized_title) for f in os.listdir(raw_dir)):
+        # Check the index for an article with the same title or URL
+        if index.contains(title=sanitized_title, url=url):
             log.info(f"Skipping already scraped article: {title}")
-            return
-
-        # Find the content container based on the provided structure
-        content = soup.select_one('div > div[style*="background-color"]')
+            return True
 
         if content and title:
             text = content.get_text(separator=os.linesep, strip=True)
-            # Create a filename from the title
-            filename = f"{sanitized_title}.txt"
-            # Ensure the directory exists
-            with open(
-                os.path.join(raw_dir, filename), "w", encoding="utf-8"
-            ) as f:
-                f.write(text)
-            log.info(f"Successfully scraped {url} and saved to {filename}")
+            text_hash = content_hash(text)
+            # Claim the article atomically so concurrent threads never write it twice
+            if not index.reserve(sanitized_title, url, text_hash):
+                log.info(f"Skipping already scraped article: {title}")
+                return True
+            try:
+                shard_path = writer.write(url, title, text)
+            except Exception:
+                # Not saved, so a later crawl must be able to scrape it again
+                index.release(sanitized_title, url, text_hash)
+                raise
+            index.commit(sanitized_title, url, text_hash)
+            log.info(f"Successfully scraped {url} and saved to {shard_path}")
         else:
             log.warning(f"Could not find content for article: {url}")
     except Exception as e:
         log.error(f"An error occurred while scraping {url}: {e}")
+        return False
+    return True
 
 if __name__ == "__main__":
     # Example usage:
@@ -84,5 +139,6 @@ if __name__ == "__main__":
     driver = webdriver.Chrome(
         service=Service(ChromeDriverManager().install()), options=options
     )
-    scrape_page(driver, "https://www.duwun.com.mm/")
+    driver.get("https://www.duwun.com.mm/")
+    scrape_page(BeautifulSoup(driver.page_source, "lxml"), "https://www.duwun.com.mm/")
     driver.quit()
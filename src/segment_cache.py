@@ -0,0 +1,94 @@
+import sqlite3
+from collections import OrderedDict
+
+
+class SegmentationCache:
+    """
+    Bounded LRU cache from a Burmese span to its word-segmented form.
+
+    With a path, the cache is backed by a SQLite file (memory-mapped, WAL
+    mode) that several worker processes can read and write at once and that
+    survives between runs. Memory misses fall through to the file; new
+    entries are written to it in batches. Each segmenter backend keeps its
+    entries in its own namespace (table) of the file.
+    """
+
+    def __init__(self, maxsize=100_000, path=None, batch_size=1000, namespace="segments"):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if not namespace.isidentifier():
+            raise ValueError(f"Invalid cache namespace {namespace!r}")
+        self.table = namespace
+
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, timeout=60)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("PRAGMA mmap_size=268435456")
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} (span TEXT PRIMARY KEY, segmented TEXT NOT NULL)"
+            )
+            self.conn.commit()
+
+    def _remember(self, span, segmented):
+        self.entries[span] = segmented
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def get(self, span):
+        """
+        Returns the cached segmentation of a span, or None on a miss.
+        """
+        segmented = self.entries.get(span)
+        if segmented is not None:
+            self.entries.move_to_end(span)
+            self.hits += 1
+            return segmented
+
+        if self.conn:
+            row = self.conn.execute(f"SELECT segmented FROM {self.table} WHERE span = ?", (span,)).fetchone()
+            if row:
+                self.disk_hits += 1
+                self._remember(span, row[0])
+                return row[0]
+
+        self.misses += 1
+        return None
+
+    def put(self, span, segmented):
+        self._remember(span, segmented)
+        if self.conn:
+            self.pending[span] = segmented
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if self.conn and self.pending:
+            self.conn.executemany(
+                f"INSERT OR IGNORE INTO {self.table} (span, segmented) VALUES (?, ?)",
+                self.pending.items(),
+            )
+            self.conn.commit()
+            self.pending.clear()
+
+    def close(self):
+        self.flush()
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "size": len(self.entries),
+        }
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import re
+import pyidaungsu as pds
+
+# Syllable breaking after Ye Kyaw Thu's sylbreak: a break goes before every
+# consonant that is not stacked (preceded by ္) and does not carry ် or ္,
+# and before every digit, independent vowel, symbol, Latin letter or space
+MY_CONSONANT = r"က-အ"
+OTHER_CHAR = r"ဣ-ဧဩဪဿ၌၍၏၀-။" + r"a-zA-Z0-9!-/:-@\[-`{-~\s"
+SYLLABLE_BREAK = re.compile(
+    r"((?<!္)[" + MY_CONSONANT + r"](?![်္])|[" + OTHER_CHAR + r"])"
+)
+
+
+def split_syllables(text):
+    return SYLLABLE_BREAK.sub(r" \1", text).split()
+
+
+class PyidaungsuSegmenter:
+    """
+    Word segmentation with pyidaungsu.
+    """
+
+    name = "pyidaungsu"
+    cache_namespace = "segments"
+
+    def segment(self, text):
+        return pds.tokenize(text, form="word")
+
+
+class SyllableTrieSegmenter:
+    """
+    Rule-based word segmentation: the text is broken into syllables with one
+    precompiled regex, then greedily grouped into the longest words found in
+    a syllable trie built from a word list (forward maximal matching).
+    Syllables that start no known word become words on their own.
+    """
+
+    name = "syllable"
+
+    def __init__(self, words=()):
+        self.trie = {}
+        self.word_count = 0
+        words = sorted(set(words))
+        for word in words:
+            self.add_word(word)
+        # Cached segmentations are only valid for the word list that produced them
+        digest = hashlib.blake2b("\n".join(words).encode("utf-8"), digest_size=6).hexdigest()
+        self.cache_namespace = f"segments_syllable_{digest}"
+
+    @classmethod
+    def from_wordlist(cls, path):
+        """
+        Builds a segmenter from a file with one word per line. A missing file
+        gives a segmenter that only breaks syllables.
+        """
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(line.strip() for line in f if line.strip())
+
+    def add_word(self, word):
+        node = self.trie
+        for syllable in split_syllables(word):
+            node = node.setdefault(syllable, {})
+        if "" not in node:
+            node[""] = True
+            self.word_count += 1
+
+    def segment(self, text):
+        syllables = split_syllables(text)
+        words = []
+        i = 0
+        while i < len(syllables):
+            node = self.trie
+            end = i + 1
+            for j in range(i, len(syllables)):
+                node = node.get(syllables[j])
+                if node is None:
+                    break
+                if "" in node:
+                    end = j + 1
+            words.append("".join(syllables[i:end]))
+            i = end
+        return words
+
+
+SEGMENTERS = {
+    PyidaungsuSegmenter.name: PyidaungsuSegmenter,
+    SyllableTrieSegmenter.name: SyllableTrieSegmenter,
+}
+
+
+def get_segmenter(name="pyidaungsu", wordlist=None):
+    """
+    Returns a segmenter backend by name. wordlist is used by the syllable backend.
+    """
+    if name not in SEGMENTERS:
+        raise ValueError(f"Unknown segmenter {name!r}, expected one of {list(SEGMENTERS)}")
+    if name == SyllableTrieSegmenter.name:
+        return SyllableTrieSegmenter.from_wordlist(wordlist)
+    return SEGMENTERS[name]()
+
+
+def build_wordlist(tokenized_path, wordlist_path, min_count=2):
+    """
+    Collects the Burmese words of an already tokenized (space-separated)
+    corpus that occur at least min_count times into a word list file.
+    """
+    counts = {}
+    burmese_word = re.compile(r"^[က-႟]+$")
+    with open(tokenized_path, "r", encoding="utf-8") as f:
+        for line in f:
+            for token in line.split():
+                token = token.rstrip("၊။")
+                if burmese_word.match(token):
+                    counts[token] = counts.get(token, 0) + 1
+    words = sorted(word for word, count in counts.items() if count >= min_count)
+    with open(wordlist_path, "w", encoding="utf-8") as f:
+        for word in words:
+            f.write(word + "\n")
+    print(f"Saved {len(words)} words to {wordlist_path}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build a word list for the syllable segmenter from a tokenized corpus.")
+    parser.add_argument("tokenized_file", help="Space-separated tokenized corpus, e.g. data/tokenized/corpus_full.txt.")
+    parser.add_argument("wordlist_file", nargs="?", default="data/wordlist.txt", help="Output word list.")
+    parser.add_argument("--min_count", type=int, default=2, help="Minimum occurrences for a word to be kept.")
+    args = parser.parse_args()
+
+    build_wordlist(args.tokenized_file, args.wordlist_file, min_count=args.min_count)
@@ -1,19 +1,49 @@
-import pyidaungsu as pds
 import os
 from pathlib import Path
 import re
 from concurrent.futures import ProcessPoolExecutor
 import multiprocessing
+import time
+from collections import deque
+from itertools import islice
+from segment_cache import SegmentationCache
+from segmenters import SEGMENTERS, PyidaungsuSegmenter, get_segmenter
 
-def tokenize_line(line):
+# Per-process segmenter backend and segmentation cache; replaced in pool workers by init_worker
+segmenter = PyidaungsuSegmenter()
+segmentation_cache = SegmentationCache()
+
+
+def init_worker(cache_path=None, cache_size=100_000, backend="pyidaungsu", wordlist=None):
+    """
+    Process pool initializer: loads the segmenter backend once per worker and
+    gives the worker its own cache, backed by the shared on-disk cache file if
+    one is given.
+    """
+    global segmenter, segmentation_cache
+    segmenter = get_segmenter(backend, wordlist)
+    segmentation_cache = SegmentationCache(
+        maxsize=cache_size, path=cache_path, namespace=segmenter.cache_namespace
+    )
+    # Load the segmenter's models now rather than on the first real line
+    segmenter.segment("မြန်မာ")
+
+
+def tokenize_line(line, cache=None, backend=None):
+    cache = cache or segmentation_cache
+    backend = backend or segmenter
     # Regex to find sequences of Burmese characters
     burmese_pattern = r'[\u1000-\u109F]+'
     
     def tokenize_burmese_match(match):
         # Remove spaces and then tokenize
         burmese_text = "".join(match.group(0).split())
-        tokens = pds.tokenize(burmese_text, form="word")
-        return " ".join(tokens)
+        segmented = cache.get(burmese_text)
+        if segmented is None:
+            tokens = backend.segment(burmese_text)
+            segmented = " ".join(tokens)
+            cache.put(burmese_text, segmented)
+        return segmented
 
     # Substitute only Burmese parts
     processed_line = re.sub(burmese_pattern, tokenize_burmese_match, line)
@@ -25,14 +55,81 @@ def tokenize_line(line):
 def process_file(input_path, output_dir):
     output_path = output_dir / input_path.name
     print(f"Processing {input_path} -> {output_path}")
+    before = segmentation_cache.stats()
     with open(input_path, 'r', encoding='utf-8') as infile, open(output_path, 'w', encoding='utf-8') as outfile:
         for line in infile:
             tokenized_line = tokenize_line(line)
             outfile.write(tokenized_line + '\n')
-    return f"Finished processing {input_path}"
+    segmentation_cache.flush()
+    after = segmentation_cache.stats()
+    hits = after["hits"] + after["disk_hits"] - before["hits"] - before["disk_hits"]
+    lookups = hits + after["misses"] - before["misses"]
+    hit_rate = hits / lookups if lookups else 0.0
+    return f"Finished processing {input_path} (segmentation cache: {hits}/{lookups} hits, {hit_rate:.1%})"
+
+
+def read_blocks(input_path, block_size):
+    """
+    Yields the lines of a file in lists of block_size lines.
+    """
+    with open(input_path, 'r', encoding='utf-8') as infile:
+        while True:
+            block = list(islice(infile, block_size))
+            if not block:
+                return
+            yield block
+
+
+def tokenize_block(lines):
+    tokenized = [tokenize_line(line) for line in lines]
+    segmentation_cache.flush()
+    return tokenized
 
 
-def main():
+def tokenize_corpus(
+    input_path,
+    output_path,
+    block_size=500,
+    cache_path=None,
+    cache_size=100_000,
+    processes=None,
+    backend="pyidaungsu",
+    wordlist=None,
+):
+    """
+    Tokenizes one large file by handing fixed-size line blocks to a worker
+    pool. Results come back in input order, and at most a few blocks per
+    worker are read ahead, so memory stays bounded and every core stays busy
+    until the last block.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    # Blocks are submitted from this thread and collected oldest first, so a
+    # worker error or an early exit never leaves a feeder blocked inside the pool
+    max_in_flight = processes * 4
+    in_flight = deque()
+
+    total_lines = 0
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(cache_path, cache_size, backend, wordlist)) as pool, \
+            open(output_path, 'w', encoding='utf-8') as outfile:
+
+        def write_oldest():
+            tokenized = in_flight.popleft().get()
+            outfile.write("".join(line + '\n' for line in tokenized))
+            return len(tokenized)
+
+        for block in read_blocks(input_path, block_size):
+            if len(in_flight) >= max_in_flight:
+                total_lines += write_oldest()
+            in_flight.append(pool.apply_async(tokenize_block, (block,)))
+        while in_flight:
+            total_lines += write_oldest()
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Tokenized {total_lines} lines in {elapsed:.1f}s ({total_lines / elapsed:.0f} lines/s) -> {output_path}")
+
+
+def main(cache_path="data/segmentation_cache.sqlite3", cache_size=100_000, backend="pyidaungsu", wordlist=None):
     sanitized_dir = Path('data/sanitized')
     tokenized_dir = Path('data/tokenized')
 
@@ -45,7 +142,11 @@ def main():
 
     files_to_process = [sanitized_dir / filename for filename in os.listdir(sanitized_dir) if filename.endswith(".txt")]
 
-    with ProcessPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
+    with ProcessPoolExecutor(
+        max_workers=multiprocessing.cpu_count(),
+        initializer=init_worker,
+        initargs=(cache_path, cache_size, backend, wordlist),
+    ) as executor:
         futures = [executor.submit(process_file, file_path, tokenized_dir) for file_path in files_to_process]
         for future in futures:
             try:
@@ -54,4 +155,36 @@ def main():
                 print(f"An error occurred: {e}")
 
 if __name__ == '__main__':
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Word-segment the sanitized corpus.")
+    parser.add_argument("--cache_path", type=str, default="data/segmentation_cache.sqlite3", help="Shared on-disk segmentation cache ('' to disable).")
+    parser.add_argument("--cache_size", type=int, default=100_000, help="Maximum in-memory cache entries per worker.")
+    parser.add_argument("--backend", choices=sorted(SEGMENTERS), default="pyidaungsu", help="Word segmentation backend.")
+    parser.add_argument("--wordlist", type=str, default="data/wordlist.txt", help="Word list for the syllable backend.")
+    parser.add_argument("--chunked", action="store_true", help="Tokenize the combined corpus in line blocks instead of file by file.")
+    parser.add_argument("--input_file", type=str, default="data/corpus_full.txt", help="Combined corpus to tokenize in chunked mode.")
+    parser.add_argument("--output_file", type=str, default="data/tokenized/corpus_full.txt", help="Output file in chunked mode.")
+    parser.add_argument("--block_size", type=int, default=500, help="Lines per block in chunked mode.")
+    args = parser.parse_args()
+
+    if args.chunked:
+        output_dir = os.path.dirname(args.output_file)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        tokenize_corpus(
+            args.input_file,
+            args.output_file,
+            block_size=args.block_size,
+            cache_path=args.cache_path or None,
+            cache_size=args.cache_size,
+            backend=args.backend,
+            wordlist=args.wordlist,
+        )
+    else:
+        main(
+            cache_path=args.cache_path or None,
+            cache_size=args.cache_size,
+            backend=args.backend,
+            wordlist=args.wordlist,
+        )
@@ -0,0 +1,82 @@
+import re
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = frozenset(
+    {"fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid", "_ga"}
+)
+TRACKING_PREFIXES = ("utm_",)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Links that never lead to an article worth scraping
+DEFAULT_EXCLUDE_PATTERNS = [
+    r"videos",
+    r"\.(?:jpe?g|png|gif|webp|svg|ico|pdf|mp3|mp4|zip|css|js)$",
+    r"^(?:mailto|tel|javascript):",
+]
+
+
+def canonicalize_url(url):
+    """
+    Normalizes a URL so that different spellings of the same page compare equal.
+    Lowercases the scheme and host, drops default ports, fragments, tracking
+    query parameters and trailing slashes, and sorts the remaining query
+    parameters, each kept exactly as written. Returns None for a malformed
+    URL, such as one with a non-numeric port.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS:
+        return url.strip()
+
+    netloc = (parts.hostname or "").lower()
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+
+    # Re-encoding would change escapes like %2B and '+', so parameters are only filtered and sorted
+    params = []
+    for param in parts.query.split("&"):
+        if not param:
+            continue
+        key = unquote_plus(param.split("=", 1)[0])
+        if key not in TRACKING_PARAMS and not key.startswith(TRACKING_PREFIXES):
+            params.append(param)
+    query = "&".join(sorted(params))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+class UrlFilter:
+    """
+    Decides which discovered URLs are crawled, using compiled regular
+    expressions. A URL is allowed if it matches none of the exclude patterns
+    and, when include patterns are given, at least one of them.
+    """
+
+    def __init__(self, exclude_patterns=DEFAULT_EXCLUDE_PATTERNS, include_patterns=None):
+        self.exclude = self._compile(exclude_patterns)
+        self.include = self._compile(include_patterns)
+
+    @staticmethod
+    def _compile(patterns):
+        if not patterns:
+            return None
+        return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+
+    def allows(self, url):
+        if self.exclude and self.exclude.search(url):
+            return False
+        if self.include and not self.include.search(url):
+            return False
+        return True
+
+
+DEFAULT_URL_FILTER = UrlFilter()